@@ -0,0 +1,73 @@
+"""
+Idle event stream benchmark: how many open /api/tasks/events/ connections one
+worker holds, and what each costs.
+
+Opens --connections streams through the async test client, reports the time
+taken and the peak memory traced per connection, then checks that one write
+wakes every stream.
+
+    python -m benchmarks.event_streams --connections 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+async def measure(connections, user_id, token):
+    from django.test import AsyncClient
+    from tasks.events import get_backend, get_broker
+
+    client = AsyncClient()
+
+    async def open_stream():
+        response = await client.get('/api/tasks/events/', headers={'Authorization': f'Token {token}'})
+        content = aiter(response.streaming_content)
+        await anext(content)
+        return response, content
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    streams = [await open_stream() for _ in range(connections)]
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{connections} idle event streams: {elapsed:.2f}s to open, '
+          f'{peak / connections / 1024:.1f} KiB peak per connection, '
+          f'{get_broker().subscription_count()} subscribed')
+
+    started = time.perf_counter()
+    get_backend().publish(user_id, {'type': 'task.deleted', 'task': {'id': 1}})
+    await asyncio.gather(*(anext(content) for _, content in streams))
+    print(f'One write woke all {connections} streams in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    for response, _ in streams:
+        response.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+        os.environ['BENCHMARK_DB_DIR'] = db_dir
+
+        import django
+        django.setup()
+
+        from django.core.management import call_command
+        from rest_framework.authtoken.models import Token
+        from tasks.models import User
+
+        call_command('migrate', verbosity=0)
+        user = User.objects.create_user('streams@bench.com', 'Password1!')
+        token = Token.objects.create(user=user).key
+        asyncio.run(measure(args.connections, user.pk, token))
+
+
+if __name__ == '__main__':
+    main()
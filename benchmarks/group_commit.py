@@ -0,0 +1,85 @@
+"""
+Task creation benchmark: one commit per request vs. group commit.
+
+Concurrent clients POST tasks to /api/tasks/ through the full Django stack
+against an on-disk SQLite database, and the script reports inserts/sec and
+request latency percentiles for each mode.
+
+    python -m benchmarks.group_commit --clients 16 --requests 50 --window-ms 2
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def run_mode(label, clients, requests_per_client, tokens):
+    from django.db import connections
+    from rest_framework.test import APIClient
+
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client_loop(token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        own_latencies = []
+        barrier.wait()
+        for i in range(requests_per_client):
+            started = time.perf_counter()
+            response = client.post('/api/tasks/', {'name': f'Task {i}', 'description': 'Benchmark',
+                                                   'due_date': '2024-03-01'}, format='json')
+            own_latencies.append(time.perf_counter() - started)
+            if response.status_code != 201:
+                raise RuntimeError(f'Request failed: {response.status_code} {response.content!r}')
+        connections.close_all()
+        with lock:
+            latencies.extend(own_latencies)
+
+    threads = [threading.Thread(target=client_loop, args=(token,)) for token in tokens[:clients]]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f'{label:<22} {len(latencies) / elapsed:8.0f} inserts/s   '
+          f'p50 {percentiles[49] * 1000:6.1f} ms   p99 {percentiles[98] * 1000:6.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client.')
+    parser.add_argument('--window-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+        os.environ['BENCHMARK_DB_DIR'] = db_dir
+
+        import django
+        django.setup()
+
+        from django.core.management import call_command
+        from django.test import override_settings
+        from rest_framework.authtoken.models import Token
+        from tasks.models import User
+
+        call_command('migrate', verbosity=0)
+        tokens = [Token.objects.create(user=User.objects.create_user(f'client{i}@bench.com', 'Password1!')).key
+                  for i in range(args.clients)]
+
+        run_mode('per-request commit', args.clients, args.requests, tokens)
+        with override_settings(TASK_GROUP_COMMIT={'ENABLED': True, 'WINDOW_MS': args.window_ms}):
+            run_mode(f'group commit ({args.window_ms:g} ms)', args.clients, args.requests, tokens)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Reminder scan benchmark: cost of a scheduler pass against a large task table.
+
+Fills an on-disk SQLite database with tasks spread over --days around today
+(most of the past ones completed), then times reminder passes: the first pass,
+a pass the next day, and an idle pass with nothing new, which still re-reads
+the window and checks it against the sent reminders. For comparison it also
+times reading every open task due by the horizon, overdue ones included.
+
+    python -m benchmarks.reminder_scan --tasks 1000000 --users 10000
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+
+class CountingSink:
+    def __init__(self):
+        self.deliveries = 0
+
+    def deliver(self, user_id, reminders):
+        self.deliveries += 1
+
+
+def populate(tasks, users, days, today):
+    from django.db import connection, transaction
+    from tasks.models import User
+
+    User.objects.bulk_create([User(email=f'user{i}@bench.com', password='!') for i in range(users)])
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    rng = random.Random(0)
+
+    def rows():
+        for i in range(tasks):
+            due_date = today + datetime.timedelta(days=rng.randint(-days // 2, days // 2))
+            completed_date = due_date if due_date < today and rng.random() < 0.9 else None
+            yield f'Task {i}', 'Benchmark', due_date, completed_date, rng.choice(user_ids)
+
+    # Raw executemany: building a million model instances would dominate the run.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany('INSERT INTO tasks_task (name, description, due_date, completed_date, user_id) '
+                           'VALUES (%s, %s, %s, %s, %s)', rows())
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def timed(label, function):
+    started = time.perf_counter()
+    result = function()
+    print(f'{label:<34} {(time.perf_counter() - started) * 1000:9.1f} ms   {result:>8} tasks')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=730, help='Spread of due dates, centred on today.')
+    parser.add_argument('--lead-days', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+        os.environ['BENCHMARK_DB_DIR'] = db_dir
+
+        import django
+        django.setup()
+
+        from django.core.management import call_command
+        from tasks.models import Task
+        from tasks.reminders import ReminderScheduler
+
+        call_command('migrate', verbosity=0)
+        today = datetime.date.today()
+        started = time.perf_counter()
+        populate(args.tasks, args.users, args.days, today)
+        print(f'Inserted {args.tasks} tasks in {time.perf_counter() - started:.1f}s\n')
+
+        sink = CountingSink()
+        scheduler = ReminderScheduler(sink=sink, lead_days=args.lead_days)
+        tomorrow = today + datetime.timedelta(days=1)
+        horizon = tomorrow + datetime.timedelta(days=args.lead_days)
+
+        timed('first pass', lambda: scheduler.run_once(today))
+        timed('next day pass', lambda: scheduler.run_once(tomorrow))
+        timed('idle pass', lambda: scheduler.run_once(tomorrow))
+        timed('all open tasks due by horizon', lambda: len(Task.objects.filter(completed_date__isnull=True,
+                                                                              due_date__lte=horizon)
+                                                                      .only('id', 'user_id', 'name', 'due_date')))
+        print(f'\n{sink.deliveries} per-user deliveries')
+
+
+if __name__ == '__main__':
+    main()
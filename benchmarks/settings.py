@@ -0,0 +1,20 @@
+"""
+Settings for the scripts in benchmarks/: the project settings, with every
+database moved into BENCHMARK_DB_DIR so runs never touch the dev databases.
+"""
+from todo_rest.settings import *  # noqa: F401,F403
+
+BENCHMARK_DB_DIR = Path(os.environ['BENCHMARK_DB_DIR'])
+
+for alias, database in DATABASES.items():
+    database['NAME'] = BENCHMARK_DB_DIR / f'{alias}.sqlite3'
+    # Writers queue on SQLite's lock rather than failing under load.
+    database['OPTIONS'] = {'timeout': 60}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# The benchmarks drive the app through Django's test client.
+ALLOWED_HOSTS = ['testserver']
+
+# Keep the slow-query log's execute wrapper, EXPLAINs and logging out of the measurements.
+TASK_SLOW_QUERY_LOG = {'ENABLED': False}
@@ -0,0 +1,83 @@
+"""
+Concurrent-writer benchmark for task sharding.
+
+Runs the same load - writer processes (standing in for server workers) each
+creating tasks for their own users, one transaction per task like
+TaskAPIView.post - against each shard count in a fresh set of SQLite files,
+and reports write throughput.
+
+    python -m benchmarks.shard_writes --shards 1 2 4 --writers 8 --tasks 200
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run(shard_count, writers, tasks_per_writer):
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections
+    from tasks.models import Task, User
+
+    for alias in connections:
+        call_command('migrate', database=alias, verbosity=0)
+
+    users = [User.objects.create_user(f'writer{i}@bench.com', 'Password1!') for i in range(writers * 4)]
+    # Forked writers must open their own connections.
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(writers + 1)
+
+    def write(writer):
+        own_users = users[writer::writers]
+        barrier.wait()
+        for i in range(tasks_per_writer):
+            Task.objects.create(user=own_users[i % len(own_users)], name=f'Task {i}',
+                                description='Benchmark', due_date='2024-03-01')
+
+    processes = [context.Process(target=write, args=(writer,)) for writer in range(writers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    if any(process.exitcode for process in processes):
+        sys.exit('A writer failed.')
+
+    total = writers * tasks_per_writer
+    print(f'{shard_count} shard(s): {total} tasks by {writers} writers in {elapsed:.2f}s '
+          f'= {total / elapsed:.0f} tasks/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--tasks', type=int, default=200, help='Tasks created per writer.')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.writers, args.tasks)
+        return
+
+    # Settings are read once per process, so each shard count gets its own.
+    for shard_count in args.shards:
+        with tempfile.TemporaryDirectory() as db_dir:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings',
+                       BENCHMARK_DB_DIR=db_dir, TASK_SHARD_COUNT=str(shard_count))
+            subprocess.run([sys.executable, '-m', 'benchmarks.shard_writes', '--run', str(shard_count),
+                            '--writers', str(args.writers), '--tasks', str(args.tasks)],
+                           env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_delete
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        from .sharding import delete_sharded_tasks
+        pre_delete.connect(delete_sharded_tasks, sender='tasks.User')
@@ -0,0 +1,259 @@
+"""
+Task change events.
+
+Write paths publish task created/updated/deleted events here, and the event
+stream view fans them out to every open connection belonging to the same user.
+Events are handed to a backend (configured with the ``TASK_EVENTS`` setting)
+which decides how they reach the brokers of each worker process.
+"""
+import asyncio
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'tasks.events.InProcessBackend'
+
+
+class Subscription:
+    '''
+    A single open event stream, owned by the event loop that created it.
+    '''
+    def __init__(self, user_id, max_queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+
+    def deliver(self, event):
+        '''
+        Queue an event for this subscription. Safe to call from any thread.
+        '''
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The owning event loop has already shut down.
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            # Drop the oldest event rather than block publishers on a slow client.
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    '''
+    Keeps track of the open subscriptions in this process, keyed by user.
+    '''
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.max_queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            user_subscriptions = self._subscriptions.get(subscription.user_id)
+            if user_subscriptions is None:
+                return
+            user_subscriptions.discard(subscription)
+            if not user_subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def subscription_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+class InProcessBackend:
+    '''
+    Delivers events straight to this process's broker. Only suitable for a
+    single worker.
+    '''
+    def __init__(self, broker, **options):
+        self.broker = broker
+
+    def publish(self, user_id, event):
+        self.broker.dispatch(user_id, event)
+
+    def close(self):
+        pass
+
+
+class FileBackend:
+    '''
+    Shares events between worker processes on the same host through an
+    append-only spool file. Each process tails the file and dispatches what it
+    reads to its own broker, so a local stand-in for a real message bus.
+
+    Once the spool grows past ``max_bytes`` the publisher that noticed renames
+    it to ``<path>.1`` (replacing the previous one) and later events start a new
+    file. Tailers finish reading the renamed file through their open handle
+    before moving on to the new one; a tailer that falls more than a whole
+    spool behind misses the events in between.
+    '''
+    def __init__(self, broker, path, poll_interval=0.1, max_bytes=10 * 1024 * 1024, **options):
+        self.broker = broker
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        # Create the spool if needed and only deliver events written from now on.
+        with open(self.path, 'a'):
+            pass
+        self._offset = os.path.getsize(self.path)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._tail, name='task-events-tail', daemon=True)
+        self._thread.start()
+
+    def publish(self, user_id, event):
+        line = json.dumps({'user_id': user_id, 'event': event}) + '\n'
+        # A single O_APPEND write keeps lines from concurrent writers intact.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, line.encode())
+            written = os.fstat(fd)
+            if written.st_size >= self.max_bytes:
+                self._rotate(written)
+        finally:
+            os.close(fd)
+
+    def _rotate(self, written):
+        try:
+            # Another publisher may have rotated it already.
+            if os.stat(self.path).st_ino == written.st_ino:
+                os.replace(self.path, f'{self.path}.1')
+        except FileNotFoundError:
+            pass
+
+    def _rotated(self, spool):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(spool.fileno()).st_ino
+        except FileNotFoundError:
+            # Renamed, and the next event hasn't created the new file yet.
+            return False
+
+    def _tail(self):
+        spool = open(self.path, 'rb')
+        spool.seek(self._offset)
+        pending = b''
+        try:
+            while not self._stopped.is_set():
+                chunk = spool.read()
+                if not chunk and self._rotated(spool):
+                    # Pick up anything written between that read and the
+                    # rename, then move on to the new file.
+                    chunk = spool.read()
+                    spool.close()
+                    spool = open(self.path, 'rb')
+                if not chunk:
+                    self._stopped.wait(self.poll_interval)
+                    continue
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    message = json.loads(line)
+                    self.broker.dispatch(message['user_id'], message['event'])
+        finally:
+            spool.close()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class EventStream:
+    '''
+    Async iterator producing the Server-Sent Events for one connection.
+
+    The subscription is only registered once the stream is first read, and is
+    released by ``close()`` (called by Django when the response finishes) or
+    when the connection task is cancelled because the client went away.
+    '''
+    def __init__(self, broker, user_id, heartbeat_interval, retry_ms):
+        self.broker = broker
+        self.user_id = user_id
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_ms = retry_ms
+        self.subscription = None
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        if self.subscription is None:
+            self.subscription = self.broker.subscribe(self.user_id)
+            return f'retry: {self.retry_ms}\n\n'
+        try:
+            event = await asyncio.wait_for(self.subscription.queue.get(), self.heartbeat_interval)
+        except asyncio.TimeoutError:
+            # Comment line, ignored by clients but keeps proxies from timing out.
+            return ': keepalive\n\n'
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    def close(self):
+        self.closed = True
+        if self.subscription is not None:
+            self.broker.unsubscribe(self.subscription)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    '''
+    Return the configured event backend, creating it on first use.
+    '''
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, 'TASK_EVENTS', {})
+            backend_class = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+            broker = EventBroker(max_queue_size=config.get('MAX_QUEUE_SIZE', 100))
+            _backend = backend_class(broker, **config.get('OPTIONS', {}))
+        return _backend
+
+
+def get_broker():
+    return get_backend().broker
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting, **kwargs):
+    global _backend
+    if setting == 'TASK_EVENTS':
+        with _backend_lock:
+            if _backend is not None:
+                _backend.close()
+            _backend = None
+
+
+def publish_task_event(user_id, event_type, data):
+    '''
+    Publish a task event once the surrounding transaction commits, so clients
+    never hear about writes that were rolled back.
+    '''
+    event = {'type': event_type, 'task': data}
+    transaction.on_commit(lambda: get_backend().publish(user_id, event))
@@ -0,0 +1,165 @@
+"""
+Group commit for task creation.
+
+With ``TASK_GROUP_COMMIT['ENABLED']``, task creations arriving within a short
+window are handed to a single writer thread, which inserts them with one
+``bulk_create`` and one commit (so one fsync) per shard instead of one per
+request. Each caller still blocks until its own row is committed and gets its
+own task back, or its own exception.
+"""
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections, transaction
+from django.dispatch import receiver
+
+from .models import Task
+from .sharding import allocate_task_ids, shard_for_user
+
+DEFAULTS = {
+    'ENABLED': False,
+    # How long the writer waits for more tasks after the first one arrives.
+    'WINDOW_MS': 5,
+    'MAX_BATCH_SIZE': 200,
+    # How long a request waits for its batch to commit before giving up.
+    'TIMEOUT': 5,
+}
+
+
+class GroupCommitTimeout(Exception):
+    '''
+    A queued task wasn't committed within ``TIMEOUT``; it has been withdrawn
+    and will not be written.
+    '''
+
+
+def group_commit_config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_GROUP_COMMIT', {})}
+
+
+class TaskWriter:
+    '''
+    Background thread that commits queued task creations in batches.
+    '''
+    def __init__(self, window_ms, max_batch_size, timeout):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.batches_committed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='task-writer', daemon=True)
+        self._thread.start()
+
+    def create(self, **fields):
+        '''
+        Queue a task for creation and wait until it has been committed.
+        '''
+        future = Future()
+        self._queue.put((Task(**fields), future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise GroupCommitTimeout('Task was not committed in time') from None
+            # The writer has already started on this task, and resolves every
+            # task it starts, so wait for the outcome rather than report a
+            # failure for a row that may still be committed.
+            return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None)
+                    break
+                batch.append(entry)
+            self._commit(batch)
+        connections.close_all()
+
+    def _commit(self, batch):
+        by_shard = defaultdict(list)
+        for task, future in batch:
+            by_shard[shard_for_user(task.user_id)].append((task, future))
+
+        for shard, entries in by_shard.items():
+            # Skip tasks whose requests timed out and withdrew them.
+            entries = [(task, future) for task, future in entries if future.set_running_or_notify_cancel()]
+            if not entries:
+                continue
+            tasks = [task for task, _ in entries]
+            try:
+                for task, task_id in zip(tasks, allocate_task_ids(len(tasks))):
+                    task.pk = task_id
+                with transaction.atomic(using=shard):
+                    Task.objects.using(shard).bulk_create(tasks)
+            except DatabaseError:
+                # Don't let one bad row fail everyone else's request.
+                self._commit_individually(entries)
+            except Exception as exc:
+                # Fail this shard's requests, but keep the writer running.
+                for _, future in entries:
+                    future.set_exception(exc)
+            else:
+                self.batches_committed += 1
+                for task, future in entries:
+                    future.set_result(task)
+
+    def _commit_individually(self, entries):
+        for task, future in entries:
+            try:
+                with transaction.atomic(using=shard_for_user(task.user_id)):
+                    task.save(force_insert=True)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(task)
+        connections.close_all()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_task_writer():
+    '''
+    Return the shared task writer, or None if group commit is disabled.
+    '''
+    global _writer
+    config = group_commit_config()
+    if not config['ENABLED']:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            _writer = TaskWriter(config['WINDOW_MS'], config['MAX_BATCH_SIZE'], config['TIMEOUT'])
+        return _writer
+
+
+@receiver(setting_changed)
+def reset_task_writer(*, setting, **kwargs):
+    global _writer
+    if setting == 'TASK_GROUP_COMMIT':
+        with _writer_lock:
+            if _writer is not None:
+                _writer.close()
+            _writer = None
@@ -0,0 +1,43 @@
+import io
+import pstats
+import re
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.profiling import profiling_config
+
+DURATION_RE = re.compile(r'_(\d+)ms\.prof$')
+
+
+class Command(BaseCommand):
+    help = 'Aggregate the request profiles written by ProfiledViewMixin and list the hottest functions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Profile directory (defaults to TASK_PROFILING["DIRECTORY"]).')
+        parser.add_argument('--route', help='Only include dumps whose method/route tag contains this text, e.g. "GET_api-tasks".')
+        parser.add_argument('--min-duration', type=int, default=0,
+                            help='Only include requests that took at least this many milliseconds.')
+        parser.add_argument('--sort', choices=['cumulative', 'tottime', 'ncalls'], default='tottime')
+        parser.add_argument('--limit', type=int, default=20, help='Number of functions to show.')
+
+    def handle(self, *args, directory, route, min_duration, sort, limit, **options):
+        directory = Path(directory or profiling_config()['DIRECTORY'])
+        dumps = []
+        for path in sorted(directory.glob('*.prof')):
+            duration = DURATION_RE.search(path.name)
+            if route and route not in path.name:
+                continue
+            if duration and int(duration.group(1)) < min_duration:
+                continue
+            dumps.append(path)
+        if not dumps:
+            raise CommandError(f'No matching profiles in {directory}.')
+
+        self.stdout.write(f'Aggregating {len(dumps)} profiles from {directory}')
+        # pstats writes each line in fragments, and self.stdout ends every write
+        # with a newline, so render the report first and write it in one go.
+        report = io.StringIO()
+        stats = pstats.Stats(*map(str, dumps), stream=report)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(report.getvalue(), ending='')
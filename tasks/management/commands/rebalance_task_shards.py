@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tasks.models import SentReminder, Tag, Task
+from tasks.sharding import shard_for_user, sync_task_id_sequence, task_shard_databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every user's tasks onto the shard TASK_SHARDS now assigns them to. "
+        "Run after changing TASK_SHARD_COUNT; keep the old shards listed in "
+        "TASK_SHARD_DATABASES until this has drained them. Users being moved "
+        "won't see their older tasks until their move finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of tasks copied per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would move without changing anything.')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        if not dry_run:
+            sync_task_id_sequence()
+
+        total = 0
+        for source in task_shard_databases():
+            user_ids = (set(Task.objects.using(source).values_list('user_id', flat=True).distinct())
+                        | set(Tag.objects.using(source).values_list('user_id', flat=True).distinct()))
+            for user_id in sorted(user_ids):
+                target = shard_for_user(user_id)
+                if target == source:
+                    continue
+                if dry_run:
+                    moved = Task.objects.using(source).filter(user_id=user_id).count()
+                else:
+                    moved = self.move_user_tasks(user_id, source, target, batch_size)
+                total += moved
+                self.stdout.write(f'User {user_id}: {moved} tasks {source} -> {target}')
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} tasks.'))
+
+    def move_user_tasks(self, user_id, source, target, batch_size):
+        '''
+        Copy a user's tasks to the target shard batch by batch, deleting each
+        batch from the source once it's committed on the target. Task ids are
+        global, so rows keep them, and re-running after a crash just skips rows
+        that were already copied. A target row with the same id but another
+        owner aborts the move before anything is deleted. Tags are matched up
+        by name, since tag ids are only unique within a shard, and sent
+        reminders go with their tasks so they aren't sent again.
+        '''
+        source_tags = dict(Tag.objects.using(source).filter(user_id=user_id).values_list('pk', 'name'))
+        Tag.objects.using(target).bulk_create([Tag(user_id=user_id, name=name) for name in source_tags.values()],
+                                              ignore_conflicts=True)
+        target_tags = dict(Tag.objects.using(target).filter(user_id=user_id).values_list('name', 'pk'))
+        TaskTag = Task.tags.through
+
+        tasks = Task.objects.using(source).filter(user_id=user_id).order_by('pk')
+        moved = 0
+        while batch := list(tasks[:batch_size]):
+            task_ids = [task.pk for task in batch]
+            task_tags = [TaskTag(task_id=task_id, tag_id=target_tags[source_tags[tag_id]])
+                         for task_id, tag_id in TaskTag.objects.using(source).filter(task_id__in=task_ids)
+                                                                            .values_list('task_id', 'tag_id')]
+            sent_reminders = [SentReminder(task_id=reminder.task_id, due_date=reminder.due_date)
+                              for reminder in SentReminder.objects.using(source).filter(task_id__in=task_ids)]
+            with transaction.atomic(using=target):
+                copied = dict(Task.objects.using(target).filter(pk__in=task_ids).values_list('pk', 'user_id'))
+                clashes = sorted(task_id for task_id, owner in copied.items() if owner != user_id)
+                if clashes:
+                    raise CommandError(f'Task ids {clashes} of user {user_id} are already used by other '
+                                       f'users on {target}; nothing was deleted from {source}.')
+                Task.objects.using(target).bulk_create([task for task in batch if task.pk not in copied])
+                TaskTag.objects.using(target).bulk_create(task_tags, ignore_conflicts=True)
+                SentReminder.objects.using(target).bulk_create(sent_reminders, ignore_conflicts=True)
+            with transaction.atomic(using=source):
+                Task.objects.using(source).filter(pk__in=task_ids).delete()
+                SentReminder.objects.using(source).filter(task_id__in=task_ids).delete()
+            moved += len(batch)
+
+        Tag.objects.using(source).filter(user_id=user_id).delete()
+        return moved
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.reminders import ReminderScheduler, reminder_config
+
+
+class Command(BaseCommand):
+    help = (
+        'Send reminders for tasks that have come within TASK_REMINDERS["LEAD_DAYS"] '
+        'of their due date. Runs as a worker, checking every INTERVAL seconds, '
+        'unless --once is given (e.g. when run from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Make a single pass and exit.')
+        parser.add_argument('--interval', type=float,
+                            help='Seconds between passes (defaults to TASK_REMINDERS["INTERVAL"]).')
+        parser.add_argument('--lead-days', type=int,
+                            help='Remind this many days ahead (defaults to TASK_REMINDERS["LEAD_DAYS"]).')
+
+    def handle(self, *args, once, interval, lead_days, **options):
+        interval = interval or reminder_config()['INTERVAL']
+        scheduler = ReminderScheduler(lead_days=lead_days)
+        while True:
+            started = time.monotonic()
+            sent = scheduler.run_once()
+            self.stdout.write(f'Sent {sent} reminders in {time.monotonic() - started:.2f}s.')
+            if once:
+                return
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                return
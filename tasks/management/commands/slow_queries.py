@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from tasks.querylog import slow_query_config
+
+
+class Command(BaseCommand):
+    help = 'List the slowest query fingerprints recorded by the slow-query log across all server processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Snapshot directory (defaults to TASK_SLOW_QUERY_LOG["DIRECTORY"]).')
+        parser.add_argument('--sort', choices=['total_ms', 'count', 'max_ms'], default='total_ms')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--reset', action='store_true', help='Delete the snapshots after reporting.')
+
+    def handle(self, *args, directory, sort, limit, reset, **options):
+        directory = Path(directory or slow_query_config()['DIRECTORY'])
+        snapshots = sorted(directory.glob('slow_queries_*.json'))
+
+        merged = {}
+        for snapshot in snapshots:
+            for entry in json.loads(snapshot.read_text()):
+                total = merged.get(entry['fingerprint'])
+                if total is None:
+                    merged[entry['fingerprint']] = entry
+                    continue
+                total['count'] += entry['count']
+                total['total_ms'] += entry['total_ms']
+                total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+                total['plan'] = total['plan'] or entry['plan']
+                for route, count in entry['routes'].items():
+                    total['routes'][route] = total['routes'].get(route, 0) + count
+
+        if not merged:
+            self.stdout.write(f'No slow queries recorded in {directory}.')
+        for entry in sorted(merged.values(), key=lambda entry: entry[sort], reverse=True)[:limit]:
+            self.stdout.write(self.style.SQL_KEYWORD(entry['fingerprint']))
+            self.stdout.write(f"  {entry['count']} runs on {entry['database']}, {entry['total_ms']:.1f} ms total, "
+                              f"{entry['total_ms'] / entry['count']:.1f} ms mean, {entry['max_ms']:.1f} ms max")
+            for route, count in sorted(entry['routes'].items(), key=lambda item: -item[1]):
+                self.stdout.write(f'  {count} from {route}')
+            if entry['plan']:
+                self.stdout.write('  Plan:')
+                for line in entry['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write('')
+
+        if reset:
+            for snapshot in snapshots:
+                snapshot.unlink(missing_ok=True)
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 22:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_task_id_sequence(apps, schema_editor):
+    # Start after any ids SQLite already handed out on the default database.
+    Task = apps.get_model('tasks', 'Task')
+    IdSequence = apps.get_model('tasks', 'IdSequence')
+    highest = Task.objects.using('default').aggregate(highest=Max('id'))['highest'] or 0
+    IdSequence.objects.using('default').create(name='task', last_value=highest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_alter_task_completed_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(create_task_id_sequence, migrations.RunPython.noop,
+                             hints={'model_name': 'idsequence'}),
+    ]
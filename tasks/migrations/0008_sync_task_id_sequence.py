@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import Max
+
+
+def sync_task_id_sequence(apps, schema_editor):
+    # Tasks created while unsharded used to take SQLite's own ids without
+    # moving the sequence; catch it up before they are allocated from it.
+    Task = apps.get_model('tasks', 'Task')
+    IdSequence = apps.get_model('tasks', 'IdSequence')
+    highest = Task.objects.using('default').aggregate(highest=Max('id'))['highest'] or 0
+    IdSequence.objects.using('default').filter(name='task', last_value__lt=highest).update(last_value=highest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_task_reminders'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_task_id_sequence, migrations.RunPython.noop,
+                             hints={'model_name': 'idsequence'}),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 
+from .sharding import allocate_task_ids, shard_for_user
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         email = self.normalize_email(email)
@@ -24,13 +26,71 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+class Tag(models.Model):
+    name = models.CharField(max_length=50)
+    # Tags live on their user's shard alongside the user's tasks.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='tag_user_name_unique'),
+        ]
+
+    def __str__(self):
+        return self.name
+
 class Task(models.Model):
     name = models.CharField(max_length=200)
     description = models.CharField(max_length=400)
     due_date = models.DateField()
     completed_date = models.DateField(null=True, blank=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Tasks may live on a different shard to their user, so no database-level constraint.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    tags = models.ManyToManyField(Tag, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'due_date'], name='task_user_due_idx'),
+            # Open tasks by due date, for the agenda and the open/overdue filters.
+            models.Index(fields=['user', 'due_date'], condition=models.Q(completed_date__isnull=True),
+                         name='task_user_open_due_idx'),
+            # Completed tasks by date, and ordering all tasks by completed date.
+            models.Index(fields=['user', 'completed_date'], name='task_user_completed_idx'),
+            # Open tasks of every user in (due_date, id) order, for the reminder scheduler.
+            models.Index(fields=['due_date'], condition=models.Q(completed_date__isnull=True),
+                         name='task_open_due_idx'),
+        ]
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # A task always lives on its owner's shard, whichever queryset saves it.
+        using = shard_for_user(self.user_id)
+        if self.pk is None:
+            # Ids come from the shared sequence even while unsharded, so they
+            # never collide once sharding is switched on.
+            self.pk = allocate_task_ids(1)[0]
+            force_insert = True
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
     def __str__(self):
         return self.title
-        
\ No newline at end of file
+
+class IdSequence(models.Model):
+    '''
+    Shared id sequences for sharded models, kept on the default database.
+    '''
+    name = models.CharField(max_length=50, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+class SentReminder(models.Model):
+    '''
+    A reminder the scheduler has delivered for a task's due date, kept on the
+    task's shard.
+    '''
+    task_id = models.BigIntegerField()
+    due_date = models.DateField()
+
+    class Meta:
+        constraints = [
+            # Led by due_date so reminders for past dates can be pruned by range.
+            models.UniqueConstraint(fields=['due_date', 'task_id'], name='sent_reminder_unique'),
+        ]
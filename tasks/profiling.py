@@ -0,0 +1,87 @@
+"""
+On-demand request profiling.
+
+Views using ``ProfiledViewMixin`` run under cProfile when the request carries
+the ``X-Profile-Key`` header matching ``TASK_PROFILING['KEY']``, or when picked
+by ``TASK_PROFILING['SAMPLE_RATE']``. Stats are dumped to
+``TASK_PROFILING['DIRECTORY']`` with the route and duration in the file name,
+keeping only the newest ``MAX_FILES``; ``manage.py profile_hotspots`` sums them up.
+"""
+import cProfile
+import hmac
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULTS = {
+    'KEY': None,
+    'SAMPLE_RATE': 0.0,
+    'DIRECTORY': Path(settings.BASE_DIR) / 'profiles',
+    'MAX_FILES': 500,
+}
+
+# Only one cProfile profiler can be active at a time on Python 3.12+, so
+# concurrent requests that would be profiled just run normally instead.
+_profiler_lock = threading.Lock()
+
+
+def profiling_config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_PROFILING', {})}
+
+
+def should_profile(request, config):
+    key = request.headers.get('X-Profile-Key')
+    if key and config['KEY'] and hmac.compare_digest(key.encode(), config['KEY'].encode()):
+        return True
+    return random.random() < config['SAMPLE_RATE']
+
+
+def profile_file_name(request, duration):
+    '''
+    Name a dump after when it was taken, the method, route and duration, e.g.
+    ``1718000000123456_GET_api-tasks-task_id_12ms.prof``.
+    '''
+    match = request.resolver_match
+    route = match.route if match else request.path
+    route = re.sub(r'[^A-Za-z0-9_]+', '-', re.sub(r'<(?:\w+:)?(\w+)>', r'\1', route)).strip('-')
+    return f'{time.time_ns() // 1000}_{request.method}_{route}_{duration * 1000:.0f}ms.prof'
+
+
+def rotate_profiles(directory, max_files):
+    dumps = sorted(directory.glob('*.prof'))
+    for old in dumps[:max(len(dumps) - max_files, 0)]:
+        old.unlink(missing_ok=True)
+
+
+class ProfiledViewMixin:
+    '''
+    Wraps a view's dispatch in cProfile when the request asks for it.
+    '''
+    def dispatch(self, request, *args, **kwargs):
+        config = profiling_config()
+        if not should_profile(request, config) or not _profiler_lock.acquire(blocking=False):
+            return super().dispatch(request, *args, **kwargs)
+
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = super().dispatch(request, *args, **kwargs)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+
+        directory = Path(config['DIRECTORY'])
+        directory.mkdir(parents=True, exist_ok=True)
+        file_name = profile_file_name(request, duration)
+        profiler.dump_stats(directory / file_name)
+        rotate_profiles(directory, config['MAX_FILES'])
+        response['X-Profile-Id'] = file_name
+        return response
@@ -0,0 +1,210 @@
+"""
+Slow-query log.
+
+When ``TASK_SLOW_QUERY_LOG['ENABLED']`` is set, ``SlowQueryLogMiddleware``
+times every query run while handling a request, through a database
+``execute_wrapper``. Queries slower than
+``TASK_SLOW_QUERY_LOG['THRESHOLD_MS']`` are logged to the
+``tasks.slow_queries`` logger and added up per SQL fingerprint (the query with
+its literals and parameters stripped out), along with the routes that ran them
+and the query plan of the first slow run. Each process writes its totals to
+``TASK_SLOW_QUERY_LOG['DIRECTORY']`` from time to time, where
+``manage.py slow_queries`` reads them.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections
+from django.dispatch import receiver
+
+logger = logging.getLogger('tasks.slow_queries')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 100,
+    'DIRECTORY': Path(settings.BASE_DIR) / 'slow_queries',
+    'FLUSH_INTERVAL': 10,
+    # Fingerprints beyond this are counted under one overflow entry.
+    'MAX_FINGERPRINTS': 500,
+}
+
+EXPLAINABLE = ('select', 'update', 'delete', 'with')
+
+_current_request = ContextVar('slow_query_request', default=None)
+
+
+def slow_query_config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_SLOW_QUERY_LOG', {})}
+
+
+def fingerprint(sql):
+    '''
+    Reduce a query to its shape, so the same query with different values
+    (including IN lists of different lengths) is counted together.
+    '''
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def current_route():
+    request = _current_request.get()
+    if request is None:
+        return None
+    match = request.resolver_match
+    return f'{request.method} {match.route if match else request.path}'
+
+
+def explain(connection, sql, params):
+    '''
+    Return the query plan for a query, as text.
+    '''
+    try:
+        with connection.cursor() as cursor:
+            # Use the backend's own cursor so the EXPLAIN skips the execute
+            # wrappers and never shows up in connection.queries.
+            cursor.cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.cursor.fetchall())
+    except (DatabaseError, connection.Database.Error) as exc:
+        # The backend's cursor raises the driver's own exceptions.
+        return f'EXPLAIN failed: {exc}'
+
+
+class SlowQueryLog:
+    '''
+    Per-fingerprint totals of the slow queries seen by this process.
+    '''
+    def __init__(self, threshold_ms, directory, flush_interval, max_fingerprints):
+        self.threshold = threshold_ms / 1000
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.max_fingerprints = max_fingerprints
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def __call__(self, execute, sql, params, many, context):
+        '''
+        Database execute wrapper: run the query and record it if it was slow.
+        '''
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                try:
+                    self.record(sql, params, many, duration, context['connection'])
+                except Exception:
+                    # Never fail a query that worked because it couldn't be logged.
+                    logger.exception('Could not record slow query')
+
+    def record(self, sql, params, many, duration, connection):
+        key = fingerprint(sql)
+        route = current_route()
+        logger.warning('Slow query (%.1f ms) on %s from %s: %s', duration * 1000, connection.alias, route, key)
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None and len(self.entries) >= self.max_fingerprints:
+                key, entry = '(other)', self.entries.get('(other)')
+            new = entry is None
+            if new:
+                entry = self.entries[key] = {
+                    'fingerprint': key, 'database': connection.alias, 'count': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0, 'routes': {}, 'example': sql, 'plan': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration * 1000
+            entry['max_ms'] = max(entry['max_ms'], duration * 1000)
+            if route:
+                entry['routes'][route] = entry['routes'].get(route, 0) + 1
+
+        # Outside the lock: explaining runs another query.
+        if new and key != '(other)' and not many and sql.lstrip().lower().startswith(EXPLAINABLE):
+            entry['plan'] = explain(connection, sql, params)
+
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def top(self, limit=10, sort='total_ms'):
+        with self._lock:
+            entries = [dict(entry, routes=dict(entry['routes'])) for entry in self.entries.values()]
+        return sorted(entries, key=lambda entry: entry[sort], reverse=True)[:limit]
+
+    def flush(self):
+        '''
+        Write this process's totals to its snapshot file.
+        '''
+        with self._lock:
+            self._last_flush = time.monotonic()
+            snapshot = json.dumps(list(self.entries.values()), default=str)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'slow_queries_{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(snapshot)
+        temporary.replace(path)
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+
+_slow_query_log = None
+_slow_query_log_lock = threading.Lock()
+
+
+def get_slow_query_log():
+    '''
+    Return this process's slow-query log, or None if it is disabled.
+    '''
+    global _slow_query_log
+    config = slow_query_config()
+    if not config['ENABLED']:
+        return None
+    with _slow_query_log_lock:
+        if _slow_query_log is None:
+            _slow_query_log = SlowQueryLog(config['THRESHOLD_MS'], config['DIRECTORY'],
+                                           config['FLUSH_INTERVAL'], config['MAX_FINGERPRINTS'])
+        return _slow_query_log
+
+
+@receiver(setting_changed)
+def reset_slow_query_log(*, setting, **kwargs):
+    global _slow_query_log
+    if setting == 'TASK_SLOW_QUERY_LOG':
+        with _slow_query_log_lock:
+            _slow_query_log = None
+
+
+class SlowQueryLogMiddleware:
+    '''
+    Times the queries of each request on every configured database.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_query_log = get_slow_query_log()
+        if slow_query_log is None:
+            return self.get_response(request)
+
+        token = _current_request.set(request)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(slow_query_log))
+                return self.get_response(request)
+        finally:
+            _current_request.reset(token)
@@ -0,0 +1,141 @@
+"""
+Due-date reminders.
+
+Each pass of ``ReminderScheduler`` pages, per shard, through the open tasks due
+between today and ``TASK_REMINDERS['LEAD_DAYS']`` days ahead in
+``task_open_due_idx`` order, skipping those with a ``SentReminder`` for their
+current due date. So a pass costs the size of that window, however many tasks
+are stored, and picks up tasks whenever they were created or rescheduled into
+it. Sent reminders for past dates are pruned as the window moves on.
+
+A pass's reminders are grouped per user and handed to the sink named by
+``TASK_REMINDERS['SINK']``, one delivery per user. They are recorded about every
+``TASK_REMINDERS['BATCH_SIZE']`` reminders delivered, so a crash mid-pass means
+up to that many are delivered again; each reminder has a stable
+``reminder_id`` for sinks that need to drop such repeats.
+"""
+import datetime
+import json
+import logging
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import SentReminder, Task
+from .sharding import task_shard_databases
+
+logger = logging.getLogger('tasks.reminders')
+
+DEFAULTS = {
+    'SINK': 'tasks.reminders.LogSink',
+    'OPTIONS': {},
+    'LEAD_DAYS': 1,
+    'BATCH_SIZE': 1000,
+    'INTERVAL': 60,
+}
+
+
+def reminder_config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_REMINDERS', {})}
+
+
+class LogSink:
+    '''
+    Writes each user's reminders to the ``tasks.reminders`` logger.
+    '''
+    def deliver(self, user_id, reminders):
+        names = ', '.join(f"{reminder['name']} ({reminder['due_date']})" for reminder in reminders)
+        logger.info('Reminding user %s of %d tasks: %s', user_id, len(reminders), names)
+
+
+class FileSink:
+    '''
+    Appends one JSON line per user delivery to a file, standing in for a
+    mail or push gateway.
+    '''
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def deliver(self, user_id, reminders):
+        line = json.dumps({'user_id': user_id, 'reminders': reminders})
+        with self._lock, self.path.open('a') as spool:
+            spool.write(line + '\n')
+
+
+def get_sink():
+    config = reminder_config()
+    return import_string(config['SINK'])(**config['OPTIONS'])
+
+
+class ReminderScheduler:
+    '''
+    Finds tasks that have newly come due and delivers reminders for them.
+    '''
+    def __init__(self, sink=None, lead_days=None, batch_size=None):
+        config = reminder_config()
+        self.sink = sink or get_sink()
+        self.lead_days = config['LEAD_DAYS'] if lead_days is None else lead_days
+        self.batch_size = batch_size or config['BATCH_SIZE']
+
+    def run_once(self, today=None):
+        '''
+        Deliver reminders for every open task due from today to ``LEAD_DAYS``
+        ahead that hasn't had one yet. Returns how many were sent.
+        '''
+        today = today or timezone.localdate()
+        horizon = today + datetime.timedelta(days=self.lead_days)
+        return sum(self.run_shard(shard, today, horizon) for shard in task_shard_databases())
+
+    def run_shard(self, shard, today, horizon):
+        SentReminder.objects.using(shard).filter(due_date__lt=today).delete()
+        due = defaultdict(list)
+        after = None
+        while batch := self.next_batch(shard, today, horizon, after):
+            for task in batch:
+                due[task.user_id].append(task)
+            last = batch[-1]
+            after = (last.due_date, last.pk)
+        # Deliver once per user for the whole pass, recording what was sent
+        # about every BATCH_SIZE reminders.
+        sent = []
+        for user_id, tasks in due.items():
+            self.deliver(user_id, tasks)
+            sent.extend(tasks)
+            if len(sent) >= self.batch_size:
+                self.record(shard, sent)
+                sent = []
+        self.record(shard, sent)
+        return sum(len(tasks) for tasks in due.values())
+
+    def next_batch(self, shard, today, horizon, after=None):
+        '''
+        Return the next open tasks due in the window, in (due_date, id) order
+        from ``after``, that haven't been reminded about for their current due
+        date.
+        '''
+        tasks = Task.objects.using(shard).filter(completed_date__isnull=True, due_date__lte=horizon)
+        if after:
+            due_date, pk = after
+            # The lower bound keeps the index range search starting at the last task seen.
+            tasks = tasks.filter(Q(due_date__gt=due_date) | Q(due_date=due_date, id__gt=pk), due_date__gte=due_date)
+        else:
+            tasks = tasks.filter(due_date__gte=today)
+        sent = SentReminder.objects.filter(task_id=OuterRef('pk'), due_date=OuterRef('due_date'))
+        return list(tasks.exclude(Exists(sent))
+                         .only('id', 'user_id', 'name', 'due_date')
+                         .order_by('due_date', 'id')[:self.batch_size])
+
+    def deliver(self, user_id, tasks):
+        self.sink.deliver(user_id, [{'reminder_id': f'{task.pk}:{task.due_date}', 'task_id': task.pk,
+                                     'name': task.name, 'due_date': str(task.due_date)}
+                                    for task in tasks])
+
+    def record(self, shard, tasks):
+        SentReminder.objects.using(shard).bulk_create(
+            [SentReminder(task_id=task.pk, due_date=task.due_date) for task in tasks], ignore_conflicts=True)
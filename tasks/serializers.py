@@ -1,7 +1,11 @@
 import re
 from django.contrib.auth import get_user_model
+from django.db import connections
 from rest_framework import serializers
-from .models import Task
+from .events import publish_task_event
+from .group_commit import get_task_writer
+from .models import Tag, Task
+from .sharding import shard_for_user
 
 User = get_user_model()
 
@@ -41,15 +45,50 @@ class UserLoginSerializer(serializers.Serializer):
             return data
         raise serializers.ValidationError("Incorrect Credentials")
 
+def get_or_create_tags(user, names):
+    '''
+    Return the user's tags with the given names, creating any that don't exist yet.
+    '''
+    names = set(names)
+    tags = list(user.tag_set.filter(name__in=names))
+    if len(tags) < len(names):
+        missing = names - {tag.name for tag in tags}
+        # Another request may create the same tags concurrently, so ignore conflicts and re-read.
+        user.tag_set.bulk_create([Tag(user=user, name=name) for name in missing], ignore_conflicts=True)
+        tags = list(user.tag_set.filter(name__in=names))
+    return tags
+
+class TagNamesField(serializers.ListField):
+    '''
+    A task's tags, as a sorted list of names.
+    '''
+    child = serializers.CharField(max_length=50)
+
+    def to_representation(self, tags):
+        # .all() is answered from the prefetch cache when the list view prefetched tags.
+        return sorted(tag.name for tag in tags.all())
+
 class TaskSerializer(serializers.ModelSerializer):
+    tags = TagNamesField(required=False)
+
     class Meta:
         model = Task
-        fields = ('id', 'name', 'description', 'due_date', 'completed_date')
+        fields = ('id', 'name', 'description', 'due_date', 'completed_date', 'tags')
         read_only_fields = ('user',)
     
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        tag_names = validated_data.pop('tags', None)
+        user = validated_data['user'] = self.context['request'].user
+        writer = get_task_writer()
+        # Inside a transaction the task has to be written on the caller's own connection.
+        if writer is not None and not connections[shard_for_user(user.pk)].in_atomic_block:
+            task = writer.create(**validated_data)
+        else:
+            task = super().create(validated_data)
+        if tag_names:
+            task.tags.set(get_or_create_tags(user, tag_names))
+        publish_task_event(task.user_id, 'task.created', self.to_representation(task))
+        return task
     
     def update(self, instance, validated_data):
         if 'name' in validated_data:
@@ -61,4 +100,7 @@ class TaskSerializer(serializers.ModelSerializer):
         if 'completed_date' in validated_data:
             instance.completed_date = validated_data['completed_date']
         instance.save()
+        if 'tags' in validated_data:
+            instance.tags.set(get_or_create_tags(instance.user, validated_data['tags']))
+        publish_task_event(instance.user_id, 'task.updated', self.to_representation(instance))
         return instance
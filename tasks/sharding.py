@@ -0,0 +1,165 @@
+"""
+Per-user sharding of tasks across several SQLite databases.
+
+SQLite only allows one writer per database file, so every user's task rows
+(which are only ever read and written per user) live on a shard chosen by a
+consistent hash of the user id. Everything else stays on ``default``.
+
+``TASK_SHARDS`` lists the database aliases new tasks are routed to, and
+``TASK_SHARD_DATABASES`` every alias that may still hold tasks (a superset,
+so shards can be drained after shrinking). See ``rebalance_task_shards``.
+"""
+import threading
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+
+# Tasks, the tags attached to them and their sent reminders live on their user's shard.
+SHARDED_MODELS = {'task', 'tag', 'task_tags', 'sentreminder'}
+
+
+def jump_hash(key, num_buckets):
+    '''
+    Jump consistent hash (Lamping & Veach). Growing from n to n + 1 buckets
+    only moves 1 / (n + 1) of the keys, all of them into the new bucket.
+    '''
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def task_shards():
+    return getattr(settings, 'TASK_SHARDS', ['default'])
+
+
+def task_shard_databases():
+    return getattr(settings, 'TASK_SHARD_DATABASES', task_shards())
+
+
+def shard_for_user(user_id):
+    shards = task_shards()
+    return shards[jump_hash(user_id, len(shards))]
+
+
+class TaskShardRouter:
+    '''
+    Routes task rows to their owner's shard.
+
+    Queries need a user to route on, so go through ``user.task_set`` (or use
+    ``Task.objects.using(shard_for_user(...))``); unhinted queries fall back to
+    ``default``.
+    '''
+    def _shard_for_hints(self, model, hints):
+        if model._meta.model_name not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._meta.model_name == 'user':
+            return shard_for_user(instance.pk)
+        if getattr(instance, 'user_id', None) is not None:
+            return shard_for_user(instance.user_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for_hints(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        model_names = {obj1._meta.model_name, obj2._meta.model_name}
+        if model_names & SHARDED_MODELS and obj1._meta.app_label == obj2._meta.app_label == 'tasks':
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in task_shard_databases():
+            return None
+        return app_label == 'tasks' and model_name in SHARDED_MODELS
+
+
+_id_block_lock = threading.Lock()
+_id_block = {'next': 0, 'end': 0}
+
+
+def allocate_task_ids(count):
+    '''
+    Return ``count`` task ids that are unique across every shard.
+
+    Ids are reserved from the ``default`` database in blocks of
+    ``TASK_ID_BLOCK_SIZE``, so only one in every block of inserts touches it.
+    Keeping ids global means rebalancing can move rows without renumbering.
+    Tasks take their ids from here even with a single shard, so switching
+    sharding on later can't hand out an id that is already in use.
+    '''
+    with _id_block_lock:
+        ids = []
+        while len(ids) < count:
+            if _id_block['next'] >= _id_block['end']:
+                needed = count - len(ids)
+                block_size = max(getattr(settings, 'TASK_ID_BLOCK_SIZE', 100), needed)
+                end = reserve_task_ids(block_size) + 1
+                start = end - block_size
+                if transaction.get_connection('default').in_atomic_block:
+                    # The reservation is undone if the caller's transaction
+                    # rolls back, so only keep the rest of the block once it
+                    # has committed.
+                    ids.extend(range(start, start + needed))
+                    transaction.on_commit(partial(_keep_id_block, start + needed, end), using='default')
+                    break
+                _id_block['next'], _id_block['end'] = start, end
+            take = min(count - len(ids), _id_block['end'] - _id_block['next'])
+            ids.extend(range(_id_block['next'], _id_block['next'] + take))
+            _id_block['next'] += take
+        return ids
+
+
+def _keep_id_block(start, end):
+    with _id_block_lock:
+        if _id_block['next'] >= _id_block['end']:
+            _id_block['next'], _id_block['end'] = start, end
+
+
+def reserve_task_ids(count):
+    '''
+    Advance the shared task id sequence by ``count`` and return its new value.
+    '''
+    IdSequence = apps.get_model('tasks', 'IdSequence')
+    with transaction.atomic(using='default'):
+        # Update first so SQLite takes the write lock before we read.
+        IdSequence.objects.filter(name='task').update(last_value=F('last_value') + count)
+        return IdSequence.objects.get(name='task').last_value
+
+
+def sync_task_id_sequence():
+    '''
+    Move the task id sequence past every id already in use on any shard, e.g.
+    ids handed out by SQLite before sharding was switched on.
+    '''
+    Task = apps.get_model('tasks', 'Task')
+    IdSequence = apps.get_model('tasks', 'IdSequence')
+    highest = max(Task.objects.using(alias).aggregate(highest=Max('id'))['highest'] or 0
+                  for alias in task_shard_databases())
+    with transaction.atomic(using='default'):
+        IdSequence.objects.filter(name='task', last_value__lt=highest).update(last_value=highest)
+    with _id_block_lock:
+        # Forget any block reserved before the sync.
+        _id_block['next'] = _id_block['end'] = 0
+
+
+def delete_sharded_tasks(sender, instance, using, **kwargs):
+    '''
+    Cascade a user's deletion to tasks and tags on their shard, which the ORM's
+    own cascade (run against the user's database) can't see.
+    '''
+    shard = shard_for_user(instance.pk)
+    if shard != using:
+        apps.get_model('tasks', 'Task').objects.using(shard).filter(user_id=instance.pk).delete()
+        apps.get_model('tasks', 'Tag').objects.using(shard).filter(user_id=instance.pk).delete()
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from tasks.events import EventBroker, FileBackend, get_backend, get_broker
+from tasks.models import User
+
+
+class TaskEventStreamTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('test@user.com', 'Password1!')
+        self.token = Token.objects.create(user=self.user).key
+        self.url = reverse('task-events')
+
+    async def open_stream(self):
+        '''
+        Open an event stream and read the preamble, which registers the subscription.
+        '''
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Token {self.token}'})
+        content = aiter(response.streaming_content)
+        self.assertTrue((await anext(content)).startswith(b'retry:'))
+        return response, content
+
+    async def test_stream_requires_token(self):
+        '''
+        Test that the event stream is only available to authenticated users
+        '''
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(self.url, headers={'Authorization': 'Token nope'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_receives_task_events(self):
+        '''
+        Test that creating, updating and deleting a task is pushed to the stream
+        '''
+        response, content = await self.open_stream()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        def write_tasks():
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            with self.captureOnCommitCallbacks(execute=True):
+                task_id = self.client.post(reverse('tasks'), {"name": "Take the bins out"
+                                                               , "description": "Got to be done!"
+                                                               , "due_date": "2024-03-01"}, format='json').data['id']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(reverse('tasks') + f'{task_id}/', {"completed_date": "2024-02-01"}, format='json')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(reverse('tasks') + f'{task_id}/')
+            return task_id
+
+        task_id = await sync_to_async(write_tasks)()
+
+        events = []
+        for _ in range(3):
+            chunk = (await anext(content)).decode()
+            event_type, data = chunk.strip().split('\n')
+            events.append((event_type, json.loads(data.removeprefix('data: '))))
+        self.assertEqual([event_type for event_type, _ in events],
+                         ['event: task.created', 'event: task.updated', 'event: task.deleted'])
+        self.assertEqual(events[0][1]['task']['name'], "Take the bins out")
+        self.assertEqual(events[1][1]['task']['completed_date'], "2024-02-01")
+        self.assertEqual(events[2][1]['task'], {'id': task_id})
+        response.close()
+
+    async def test_stream_only_sees_own_tasks(self):
+        '''
+        Test that events for another user's tasks are not delivered
+        '''
+        response, content = await self.open_stream()
+        get_backend().publish(self.user.pk + 1, {'type': 'task.created', 'task': {'id': 1}})
+        get_backend().publish(self.user.pk, {'type': 'task.created', 'task': {'id': 2}})
+        self.assertIn(b'"id": 2', await anext(content))
+        response.close()
+
+    async def test_idle_connections_share_one_worker(self):
+        '''
+        Test that many idle streams are held at once and all woken by a write
+        '''
+        connections = 20
+        streams = [await self.open_stream() for _ in range(connections)]
+        self.assertEqual(get_broker().subscription_count(), connections)
+
+        get_backend().publish(self.user.pk, {'type': 'task.deleted', 'task': {'id': 1}})
+        chunks = await asyncio.gather(*(anext(content) for _, content in streams))
+        self.assertTrue(all(chunk.startswith(b'event: task.deleted') for chunk in chunks))
+
+        for response, _ in streams:
+            response.close()
+        self.assertEqual(get_broker().subscription_count(), 0)
+
+
+class FileBackendTests(TestCase):
+    async def test_events_shared_between_workers(self):
+        '''
+        Test that two workers sharing a spool file both see each other's events
+        '''
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = Path(spool_dir) / 'events.log'
+            first = FileBackend(EventBroker(), path, poll_interval=0.01)
+            second = FileBackend(EventBroker(), path, poll_interval=0.01)
+            try:
+                subscription = second.broker.subscribe(1)
+                first.publish(1, {'type': 'task.created', 'task': {'id': 1}})
+                event = await asyncio.wait_for(subscription.queue.get(), 5)
+                self.assertEqual(event['task'], {'id': 1})
+            finally:
+                first.close()
+                second.close()
+
+    async def test_spool_rotated(self):
+        '''
+        Test that a full spool is rotated without losing events on either side
+        '''
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = Path(spool_dir) / 'events.log'
+            publisher = FileBackend(EventBroker(), path, poll_interval=0.01, max_bytes=200)
+            tailer = FileBackend(EventBroker(), path, poll_interval=0.01)
+            try:
+                subscription = tailer.broker.subscribe(1)
+                for task_id in range(10):
+                    publisher.publish(1, {'type': 'task.created', 'task': {'id': task_id}})
+                    event = await asyncio.wait_for(subscription.queue.get(), 5)
+                    self.assertEqual(event['task'], {'id': task_id})
+                self.assertTrue(Path(f'{path}.1').exists())
+                self.assertLess(path.stat().st_size, 200)
+            finally:
+                publisher.close()
+                tailer.close()
+
+    async def test_backend_configured_from_settings(self):
+        '''
+        Test that the TASK_EVENTS setting selects the backend
+        '''
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = Path(spool_dir) / 'events.log'
+            with override_settings(TASK_EVENTS={'BACKEND': 'tasks.events.FileBackend', 'OPTIONS': {'path': path}}):
+                self.assertIsInstance(get_backend(), FileBackend)
+            self.assertNotIsInstance(get_backend(), FileBackend)
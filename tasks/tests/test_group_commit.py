@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import IntegrityError, connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from tasks.group_commit import get_task_writer
+from tasks.models import User
+
+# Wide enough that concurrently submitted tasks reliably share a batch.
+GROUP_COMMIT = {'ENABLED': True, 'WINDOW_MS': 200, 'MAX_BATCH_SIZE': 50}
+
+
+@override_settings(TASK_GROUP_COMMIT=GROUP_COMMIT)
+class GroupCommitTests(TransactionTestCase):
+    # The writer thread commits on its own connection, so tests can't run in a transaction.
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user('test@user.com', 'Password1!')
+
+    def create_tasks(self, fields_list):
+        '''
+        Submit tasks to the writer concurrently, returning each task or exception.
+        '''
+        writer = get_task_writer()
+
+        def create(fields):
+            try:
+                return writer.create(**fields)
+            except Exception as exc:
+                return exc
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=len(fields_list)) as executor:
+            return list(executor.map(create, fields_list))
+
+    def task_fields(self, i):
+        return {'user': self.user, 'name': f'Task {i}', 'description': 'Got to be done!', 'due_date': '2024-03-01'}
+
+    def test_concurrent_creates_share_a_commit(self):
+        '''
+        Test that concurrent creations are committed together but each gets its own id
+        '''
+        batches = get_task_writer().batches_committed
+        tasks = self.create_tasks([self.task_fields(i) for i in range(20)])
+        self.assertEqual(len({task.pk for task in tasks}), 20)
+        self.assertEqual(self.user.task_set.filter(pk__in=[task.pk for task in tasks]).count(), 20)
+        self.assertLess(get_task_writer().batches_committed - batches, 20)
+
+    def test_failed_task_does_not_fail_batch(self):
+        '''
+        Test that a task which can't be inserted only fails its own request
+        '''
+        fields_list = [self.task_fields(i) for i in range(5)]
+        fields_list[2]['due_date'] = None
+        results = self.create_tasks(fields_list)
+        self.assertIsInstance(results[2], IntegrityError)
+        self.assertEqual(self.user.task_set.count(), 4)
+        for i in (0, 1, 3, 4):
+            self.assertEqual(self.user.task_set.get(pk=results[i].pk).name, f'Task {i}')
+
+    def test_create_task_through_view(self):
+        '''
+        Test that the task endpoint works unchanged with group commit enabled
+        '''
+        batches = get_task_writer().batches_committed
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        response = client.post(reverse('tasks'), {"name": "Take the bins out"
+                                                  , "description": "Got to be done!"
+                                                  , "due_date": "2024-03-01"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.user.task_set.get(pk=response.data['id']).name, "Take the bins out")
+        self.assertEqual(get_task_writer().batches_committed - batches, 1)
+
+    def test_unexpected_error_fails_only_its_batch(self):
+        '''
+        Test that an error outside the insert fails its batch but leaves the writer running
+        '''
+        with mock.patch('tasks.group_commit.allocate_task_ids', side_effect=RuntimeError('Sequence unavailable')):
+            [result] = self.create_tasks([self.task_fields(0)])
+        self.assertIsInstance(result, RuntimeError)
+        [task] = self.create_tasks([self.task_fields(1)])
+        self.assertEqual(self.user.task_set.get().pk, task.pk)
+
+    @override_settings(TASK_GROUP_COMMIT={**GROUP_COMMIT, 'WINDOW_MS': 500, 'TIMEOUT': 0.05})
+    def test_timed_out_task_withdrawn(self):
+        '''
+        Test that a request timing out gets a 503 and its task is never written
+        '''
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        response = client.post(reverse('tasks'), {"name": "Take the bins out"
+                                                  , "description": "Got to be done!"
+                                                  , "due_date": "2024-03-01"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        # Closing waits for the writer to finish the batch.
+        get_task_writer().close()
+        self.assertFalse(self.user.task_set.exists())
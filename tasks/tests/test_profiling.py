@@ -0,0 +1,73 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .test_views import TestUtils
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.settings_override = override_settings(TASK_PROFILING={'KEY': 'let-me-profile',
+                                                                   'DIRECTORY': self.directory})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        user_response = TestUtils.register_default_test_user(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user_response.data["token"]}')
+
+    def test_profile_with_key(self):
+        '''
+        Test that a request with the profiling key is profiled, tagged with its route
+        '''
+        response = self.client.get(reverse('tasks'), HTTP_X_PROFILE_KEY='let-me-profile')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        dumps = list(self.directory.glob('*.prof'))
+        self.assertEqual([dump.name for dump in dumps], [response['X-Profile-Id']])
+        self.assertIn('_GET_api-tasks_', dumps[0].name)
+
+    def test_no_profile_without_key(self):
+        '''
+        Test that requests without (or with the wrong) key are not profiled
+        '''
+        self.client.get(reverse('tasks'))
+        response = self.client.get(reverse('tasks'), HTTP_X_PROFILE_KEY='guess')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.directory.glob('*.prof')), [])
+
+    def test_sampled_profiles_rotate(self):
+        '''
+        Test that sampled requests are profiled, keeping only the newest dumps
+        '''
+        with override_settings(TASK_PROFILING={'SAMPLE_RATE': 1.0, 'DIRECTORY': self.directory, 'MAX_FILES': 2}):
+            names = [self.client.get(reverse('tasks'))['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(dump.name for dump in self.directory.glob('*.prof')), sorted(names[1:]))
+
+    def test_hotspots_command(self):
+        '''
+        Test that the hotspots command aggregates dumps, optionally filtered by route
+        '''
+        self.client.get(reverse('tasks'), HTTP_X_PROFILE_KEY='let-me-profile')
+        self.client.post(reverse('login'), {'email': 'test@user.com', 'password': 'Password1!'},
+                         format='json', HTTP_X_PROFILE_KEY='let-me-profile')
+        out = StringIO()
+        call_command('profile_hotspots', stdout=out)
+        self.assertIn('Aggregating 2 profiles', out.getvalue())
+        # The summary and the table header each stay on one line.
+        self.assertRegex(out.getvalue(), r'\d+ function calls .*in [\d.]+ seconds')
+        self.assertRegex(out.getvalue(), r'ncalls +tottime +percall +cumtime +percall +filename:lineno\(function\)')
+        self.assertRegex(out.getvalue(), r'\n +[\d/]+ +[\d.]+ +[\d.]+ +[\d.]+ +[\d.]+ +\S+:\d+\(')
+        out = StringIO()
+        call_command('profile_hotspots', route='POST_api-login', stdout=out)
+        self.assertIn('Aggregating 1 profiles', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('profile_hotspots', route='DELETE', stdout=StringIO())
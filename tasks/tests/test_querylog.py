@@ -0,0 +1,98 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from tasks.querylog import SlowQueryLog, explain, fingerprint, get_slow_query_log
+
+from .test_views import TestUtils
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_removed(self):
+        '''
+        Test that queries differing only in values share a fingerprint
+        '''
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'it''s'"),
+                         'SELECT * FROM t WHERE id = ? AND name = ?')
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s,%s)'),
+                         fingerprint('SELECT * FROM t\n WHERE id IN (%s)'))
+
+
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        # A zero threshold makes every query "slow".
+        self.settings_override = override_settings(TASK_SLOW_QUERY_LOG={'ENABLED': True, 'THRESHOLD_MS': 0,
+                                                                        'DIRECTORY': self.directory})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        with self.assertLogs('tasks.slow_queries'):
+            user_response = TestUtils.register_default_test_user(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user_response.data["token"]}')
+
+    def test_slow_queries_recorded_with_route_and_plan(self):
+        '''
+        Test that slow queries are totalled per fingerprint, with their routes and plan
+        '''
+        with self.assertLogs('tasks.slow_queries') as logs:
+            self.client.get(reverse('tasks') + '?name=bins')
+            self.client.get(reverse('tasks') + '?name=washing')
+        self.assertTrue(any('GET api/tasks/' in line for line in logs.output))
+
+        entries = get_slow_query_log().top(limit=100)
+        task_query = next(entry for entry in entries
+                          if 'FROM "tasks_task"' in entry['fingerprint'] and 'LIKE' in entry['fingerprint'])
+        self.assertEqual(task_query['count'], 2)
+        self.assertEqual(task_query['routes'], {'GET api/tasks/': 2})
+        self.assertIn('tasks_task', task_query['plan'])
+
+        token_query = next(entry for entry in entries if 'FROM "authtoken_token"' in entry['fingerprint'])
+        self.assertEqual(token_query['routes'], {'GET api/tasks/': 2})
+
+    def test_command_reports_top_queries(self):
+        '''
+        Test that the management command merges and reports flushed totals
+        '''
+        with self.assertLogs('tasks.slow_queries'):
+            self.client.get(reverse('tasks'))
+        get_slow_query_log().flush()
+        out = StringIO()
+        call_command('slow_queries', limit=100, reset=True, stdout=out)
+        self.assertIn('FROM "authtoken_token"', out.getvalue())
+        self.assertIn('Plan:', out.getvalue())
+        self.assertEqual(list(self.directory.glob('*.json')), [])
+
+    def test_explain_errors_reported_in_plan(self):
+        '''
+        Test that a query plan that can't be produced is reported rather than raised
+        '''
+        plan = explain(connection, 'SELECT * FROM no_such_table WHERE id = %s', [1])
+        self.assertTrue(plan.startswith('EXPLAIN failed'))
+
+    def test_recording_errors_do_not_fail_requests(self):
+        '''
+        Test that a failure in the slow-query log doesn't fail the request that ran the query
+        '''
+        with mock.patch.object(SlowQueryLog, 'record', side_effect=RuntimeError('Log unavailable')), \
+                self.assertLogs('tasks.slow_queries', 'ERROR'):
+            response = self.client.get(reverse('tasks'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TASK_SLOW_QUERY_LOG={'ENABLED': True, 'THRESHOLD_MS': 10_000})
+    def test_fast_queries_ignored(self):
+        '''
+        Test that queries under the threshold are not recorded
+        '''
+        self.client.get(reverse('tasks'))
+        self.assertEqual(get_slow_query_log().top(), [])
@@ -0,0 +1,168 @@
+import datetime
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tasks.models import SentReminder, Task, User
+from tasks.reminders import ReminderScheduler
+from tasks.sharding import task_shard_databases
+
+TODAY = datetime.date(2024, 3, 1)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.deliveries = []
+
+    def deliver(self, user_id, reminders):
+        self.deliveries.append((user_id, reminders))
+
+    def task_ids(self):
+        return sorted(reminder['task_id'] for _, reminders in self.deliveries for reminder in reminders)
+
+
+class ReminderSchedulerTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice@user.com', 'Password1!')
+        self.bob = User.objects.create_user('bob@user.com', 'Password1!')
+        self.sink = RecordingSink()
+
+    def create_task(self, user, days, completed=False):
+        task = Task(user=user, name=f'Task due in {days} days', description='Reminder test',
+                    due_date=TODAY + datetime.timedelta(days=days), completed_date=TODAY if completed else None)
+        task.save()
+        return task
+
+    def scheduler(self, **kwargs):
+        return ReminderScheduler(sink=self.sink, lead_days=1, **kwargs)
+
+    def recorded_task_ids(self):
+        return sorted(task_id for shard in task_shard_databases()
+                      for task_id in SentReminder.objects.using(shard).values_list('task_id', flat=True))
+
+    def test_reminds_open_tasks_coming_due_per_user(self):
+        '''
+        Test that open tasks due today or tomorrow are reminded, batched per user
+        '''
+        due = [self.create_task(self.alice, 0), self.create_task(self.alice, 1), self.create_task(self.bob, 1)]
+        self.create_task(self.alice, -1)
+        self.create_task(self.alice, 2)
+        self.create_task(self.bob, 0, completed=True)
+
+        self.assertEqual(self.scheduler().run_once(TODAY), 3)
+        self.assertEqual(self.sink.task_ids(), sorted(task.pk for task in due))
+        self.assertEqual(sorted((user_id, len(reminders)) for user_id, reminders in self.sink.deliveries),
+                         [(self.alice.pk, 2), (self.bob.pk, 1)])
+        reminder = next(reminder for _, reminders in self.sink.deliveries for reminder in reminders
+                        if reminder['task_id'] == due[0].pk)
+        self.assertEqual(reminder['reminder_id'], f'{due[0].pk}:2024-03-01')
+
+    def test_later_passes_only_send_newly_due_tasks(self):
+        '''
+        Test that each pass only reminds about tasks not yet reminded, across restarts
+        '''
+        self.create_task(self.alice, 0)
+        self.scheduler().run_once(TODAY)
+        self.assertEqual(self.scheduler().run_once(TODAY), 0)
+
+        later_today = self.create_task(self.bob, 0)
+        day_after = self.create_task(self.alice, 2)
+        self.sink.deliveries.clear()
+        self.assertEqual(self.scheduler().run_once(TODAY), 1)
+        self.assertEqual(self.sink.task_ids(), [later_today.pk])
+
+        self.sink.deliveries.clear()
+        self.assertEqual(self.scheduler().run_once(TODAY + datetime.timedelta(days=1)), 1)
+        self.assertEqual(self.sink.task_ids(), [day_after.pk])
+
+    def test_out_of_order_ids_reminded(self):
+        '''
+        Test that a task saved with a lower id than ones already reminded about is still picked up
+        '''
+        high = Task(pk=1000, user=self.alice, name='High id', description='Reminder test', due_date=TODAY)
+        high.save(force_insert=True)
+        self.scheduler().run_once(TODAY)
+        # E.g. another worker handing out ids from an earlier block.
+        low = Task(pk=10, user=self.bob, name='Low id', description='Reminder test', due_date=TODAY)
+        low.save(force_insert=True)
+        self.sink.deliveries.clear()
+        self.assertEqual(self.scheduler().run_once(TODAY), 1)
+        self.assertEqual(self.sink.task_ids(), [low.pk])
+
+    def test_task_added_inside_window_reminded(self):
+        '''
+        Test that a task created due today after tomorrow's tasks were reminded is still picked up
+        '''
+        self.create_task(self.alice, 1)
+        self.scheduler().run_once(TODAY)
+        due_today = self.create_task(self.bob, 0)
+        self.sink.deliveries.clear()
+        self.assertEqual(self.scheduler().run_once(TODAY), 1)
+        self.assertEqual(self.sink.task_ids(), [due_today.pk])
+
+    def test_rescheduled_task_reminded_again(self):
+        '''
+        Test that moving a reminded task to another date in the window reminds about the new date
+        '''
+        task = self.create_task(self.alice, 0)
+        self.scheduler().run_once(TODAY)
+        task.due_date = TODAY + datetime.timedelta(days=1)
+        task.save()
+        self.sink.deliveries.clear()
+        self.assertEqual(self.scheduler().run_once(TODAY), 1)
+        [(_, [reminder])] = self.sink.deliveries
+        self.assertEqual(reminder['reminder_id'], f'{task.pk}:2024-03-02')
+
+    def test_batches_recorded_and_old_reminders_pruned(self):
+        '''
+        Test that a pass read in batches is delivered once per user and recorded, and past records are dropped
+        '''
+        tasks = [self.create_task(self.alice, days) for days in (0, 0, 1, 1, 1)] + [self.create_task(self.bob, 1)]
+        self.assertEqual(self.scheduler(batch_size=2).run_once(TODAY), 6)
+        self.assertEqual(sorted((user_id, len(reminders)) for user_id, reminders in self.sink.deliveries),
+                         [(self.alice.pk, 5), (self.bob.pk, 1)])
+        self.assertEqual(self.recorded_task_ids(), sorted(task.pk for task in tasks))
+        self.scheduler().run_once(TODAY + datetime.timedelta(days=1))
+        self.assertEqual(self.recorded_task_ids(), sorted(task.pk for task in tasks[2:]))
+
+    def test_scan_uses_due_date_index(self):
+        '''
+        Test that the first and later pages walk the open task due date index without sorting
+        '''
+        scheduler = self.scheduler()
+        with CaptureQueriesContext(connection) as queries:
+            scheduler.next_batch('default', TODAY, TODAY)
+            scheduler.next_batch('default', TODAY, TODAY, after=(TODAY, 10))
+        for query in queries.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = '\n'.join(str(row) for row in cursor.fetchall())
+            self.assertIn('task_open_due_idx', plan)
+            # SQLite's own index for the unique constraint.
+            self.assertIn('COVERING INDEX sqlite_autoindex_tasks_sentreminder', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_file_sink_and_command(self):
+        '''
+        Test that the command delivers reminders through the configured sink
+        '''
+        Task(user=self.alice, name='Bins', description='Put the bins out', due_date=timezone.localdate()).save()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'reminders.jsonl'
+            with override_settings(TASK_REMINDERS={'SINK': 'tasks.reminders.FileSink', 'OPTIONS': {'path': path}}):
+                out = StringIO()
+                call_command('send_reminders', once=True, stdout=out)
+            self.assertIn('Sent 1 reminders', out.getvalue())
+            [line] = path.read_text().splitlines()
+        delivery = json.loads(line)
+        self.assertEqual(delivery['user_id'], self.alice.pk)
+        self.assertEqual([reminder['name'] for reminder in delivery['reminders']], ['Bins'])
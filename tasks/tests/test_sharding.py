@@ -0,0 +1,177 @@
+import unittest
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from tasks.models import IdSequence, SentReminder, Task, User
+from tasks.sharding import TaskShardRouter, allocate_task_ids, jump_hash, shard_for_user, sync_task_id_sequence
+
+SHARDS = ['default', 'tasks_shard_1', 'tasks_shard_2']
+
+
+class JumpHashTests(SimpleTestCase):
+    def test_buckets_in_range(self):
+        '''
+        Test that every key lands in one of the buckets
+        '''
+        for buckets in range(1, 10):
+            self.assertTrue(all(0 <= jump_hash(key, buckets) < buckets for key in range(1000)))
+
+    def test_growing_only_moves_keys_to_new_bucket(self):
+        '''
+        Test that adding a shard only moves users onto the new shard
+        '''
+        moved = 0
+        for key in range(10000):
+            before, after = jump_hash(key, 3), jump_hash(key, 4)
+            if before != after:
+                self.assertEqual(after, 3)
+                moved += 1
+        # Roughly a quarter of the keys should move.
+        self.assertAlmostEqual(moved / 10000, 0.25, delta=0.03)
+
+
+@override_settings(TASK_SHARDS=SHARDS, TASK_SHARD_DATABASES=SHARDS)
+class TaskShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = TaskShardRouter()
+        self.user = User(pk=42)
+
+    def test_tasks_routed_by_user(self):
+        '''
+        Test that a user's tasks, and queries through the user, go to the user's shard
+        '''
+        shard = shard_for_user(42)
+        self.assertEqual(self.router.db_for_read(Task, instance=self.user), shard)
+        self.assertEqual(self.router.db_for_write(Task, instance=Task(user=self.user)), shard)
+
+    def test_other_models_not_routed(self):
+        '''
+        Test that users and unhinted task queries are left on the default database
+        '''
+        self.assertIsNone(self.router.db_for_read(User, instance=self.user))
+        self.assertIsNone(self.router.db_for_write(Task))
+
+    def test_only_tasks_migrated_to_shards(self):
+        '''
+        Test that shards only get the task table
+        '''
+        self.assertTrue(self.router.allow_migrate('tasks_shard_1', 'tasks', model_name='task'))
+        self.assertFalse(self.router.allow_migrate('tasks_shard_1', 'tasks', model_name='user'))
+        self.assertFalse(self.router.allow_migrate('tasks_shard_1', 'authtoken', model_name='token'))
+        self.assertIsNone(self.router.allow_migrate('default', 'tasks', model_name='user'))
+
+
+class TaskIdAllocationTests(TestCase):
+    databases = '__all__'
+
+    @override_settings(TASK_ID_BLOCK_SIZE=3)
+    def test_ids_unique_across_blocks(self):
+        '''
+        Test that allocated ids never repeat, however they are requested
+        '''
+        ids = allocate_task_ids(2) + allocate_task_ids(5) + allocate_task_ids(1)
+        self.assertEqual(len(set(ids)), 8)
+
+    def test_unsharded_tasks_take_ids_from_sequence(self):
+        '''
+        Test that tasks draw ids from the shared sequence even with one shard
+        '''
+        # Forget any ids cached by earlier tests.
+        sync_task_id_sequence()
+        user = User.objects.create_user('test@user.com', 'Password1!')
+        with override_settings(TASK_SHARDS=['default']):
+            task = Task.objects.create(user=user, name='Bins', description='Put the bins out', due_date='2024-03-01')
+        self.assertLessEqual(task.pk, IdSequence.objects.get(name='task').last_value)
+
+
+@unittest.skipUnless(len(settings.TASK_SHARDS) > 1, 'Run with TASK_SHARD_COUNT > 1')
+class ShardedTaskTests(APITestCase):
+    databases = '__all__'
+
+    def create_user_with_task(self, email):
+        self.client.credentials()
+        token = self.client.post(reverse('register'), {'email': email, 'password': 'Password1!'},
+                                 format='json').data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        response = self.client.post(reverse('tasks'), {"name": f"Task for {email}"
+                                                       , "description": "Got to be done!"
+                                                       , "due_date": "2024-03-01"
+                                                       , "tags": ["home", email]}, format='json')
+        return User.objects.get(email=email), response.data['id']
+
+    def test_tasks_stored_on_users_shard(self):
+        '''
+        Test that tasks are written to, and read back from, their user's shard
+        '''
+        for i in range(10):
+            user, task_id = self.create_user_with_task(f'user{i}@user.com')
+            shard = shard_for_user(user.pk)
+            self.assertTrue(Task.objects.using(shard).filter(pk=task_id, user=user).exists())
+            response = self.client.get(reverse('tasks') + f'{task_id}/', format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        used_shards = {shard_for_user(user.pk) for user in User.objects.all()}
+        self.assertGreater(len(used_shards), 1)
+
+    def test_rebalance_moves_tasks(self):
+        '''
+        Test that rebalancing after a shard count change moves tasks, and their tags, without renumbering them
+        '''
+        tasks = dict(self.create_user_with_task(f'user{i}@user.com') for i in range(10))
+        for user, task_id in tasks.items():
+            SentReminder.objects.using(shard_for_user(user.pk)).create(task_id=task_id, due_date='2024-03-01')
+        with override_settings(TASK_SHARDS=settings.TASK_SHARDS[:1]):
+            call_command('rebalance_task_shards', stdout=StringIO())
+            self.assertEqual(Task.objects.using('default').count(), 10)
+        call_command('rebalance_task_shards', stdout=StringIO())
+        for user, task_id in tasks.items():
+            self.assertEqual(list(user.task_set.values_list('id', flat=True)), [task_id])
+            self.assertEqual(sorted(user.task_set.get().tags.values_list('name', flat=True)), ['home', user.email])
+            self.assertEqual(user.tag_set.count(), 2)
+            self.assertTrue(SentReminder.objects.using(shard_for_user(user.pk)).filter(task_id=task_id).exists())
+        self.assertEqual(sum(SentReminder.objects.using(alias).count() for alias in SHARDS), 10)
+
+    def test_switching_sharding_on_keeps_tasks(self):
+        '''
+        Test that tasks created before and after sharding is switched on get distinct ids and all survive a rebalance
+        '''
+        with override_settings(TASK_SHARDS=settings.TASK_SHARDS[:1]):
+            before = [self.create_user_with_task(f'before{i}@user.com') for i in range(6)]
+        after = [self.create_user_with_task(f'after{i}@user.com') for i in range(6)]
+        task_ids = [task_id for alias in SHARDS for task_id in Task.objects.using(alias).values_list('id', flat=True)]
+        self.assertEqual(len(task_ids), 12)
+        self.assertEqual(len(set(task_ids)), 12)
+
+        call_command('rebalance_task_shards', stdout=StringIO())
+        for user, task_id in before + after:
+            self.assertEqual(list(user.task_set.values_list('id', flat=True)), [task_id])
+
+    def test_rebalance_aborts_on_id_clash(self):
+        '''
+        Test that a rebalance stops, without deleting anything, if a task's id is taken on its new shard
+        '''
+        with override_settings(TASK_SHARDS=settings.TASK_SHARDS[:1]):
+            tasks = [self.create_user_with_task(f'user{i}@user.com') for i in range(10)]
+        user, task_id = next((user, task_id) for user, task_id in tasks if shard_for_user(user.pk) != 'default')
+        target = shard_for_user(user.pk)
+        Task.objects.using(target).bulk_create([Task(pk=task_id, user_id=user.pk + 1000, name='Someone else',
+                                                     description='Clash', due_date='2024-03-01')])
+
+        with self.assertRaises(CommandError):
+            call_command('rebalance_task_shards', stdout=StringIO())
+        self.assertTrue(Task.objects.using('default').filter(pk=task_id, user=user).exists())
+
+    def test_deleting_user_deletes_sharded_tasks(self):
+        '''
+        Test that a user's tasks on another shard are removed with the user
+        '''
+        for i in range(10):
+            user, task_id = self.create_user_with_task(f'user{i}@user.com')
+            shard = shard_for_user(user.pk)
+            user.delete()
+            self.assertFalse(Task.objects.using(shard).filter(pk=task_id).exists())
@@ -1,6 +1,10 @@
+from datetime import timedelta
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from tasks.models import SentReminder, Task, User
 
 class TestUtils:
         '''
@@ -359,3 +363,271 @@ class TaskTests(APITestCase):
         url = reverse('tasks')
         response = self.client.delete(url + '123/', format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TaskAgendaTests(APITestCase):
+    def setUp(self):
+        '''
+        Create a user with a mix of open, completed and overdue tasks.
+        '''
+        user_response = TestUtils.register_default_test_user(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user_response.data["token"]}')
+        self.user = User.objects.get(email='test@user.com')
+        today = timezone.localdate()
+        self.overdue = self.create_task("Pay the bills", today - timedelta(days=2))
+        self.due_soon = self.create_task("Take the bins out", today + timedelta(days=1))
+        self.due_later = self.create_task("Do the washing up", today + timedelta(days=7))
+        self.completed = self.create_task("Create a REST API", today - timedelta(days=5),
+                                          completed_date=str(today - timedelta(days=1)))
+
+    def create_task(self, name, due_date, **extra):
+        task_data = {"name": name, "description": "Got to be done!", "due_date": str(due_date), **extra}
+        response = self.client.post(reverse('tasks'), task_data, format='json')
+        return response.data['id']
+
+    def test_filter_by_status(self):
+        '''
+        Test that tasks can be filtered to open, completed or overdue ones
+        '''
+        url = reverse('tasks')
+        response = self.client.get(url + '?status=open', format='json')
+        self.assertEqual({task['id'] for task in response.data}, {self.overdue, self.due_soon, self.due_later})
+        response = self.client.get(url + '?status=completed', format='json')
+        self.assertEqual([task['id'] for task in response.data], [self.completed])
+        response = self.client.get(url + '?status=overdue', format='json')
+        self.assertEqual([task['id'] for task in response.data], [self.overdue])
+        response = self.client.get(url + '?status=someday', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering(self):
+        '''
+        Test that tasks can be ordered by due date, completed date or id, in either direction
+        '''
+        url = reverse('tasks')
+        response = self.client.get(url + '?ordering=due_date', format='json')
+        self.assertEqual([task['id'] for task in response.data],
+                         [self.completed, self.overdue, self.due_soon, self.due_later])
+        response = self.client.get(url + '?ordering=-due_date&limit=2', format='json')
+        self.assertEqual([task['id'] for task in response.data], [self.due_later, self.due_soon])
+        response = self.client.get(url + '?ordering=-id', format='json')
+        self.assertEqual([task['id'] for task in response.data],
+                         [self.completed, self.due_later, self.due_soon, self.overdue])
+        response = self.client.get(url + '?ordering=name', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url + '?limit=0', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_dates_rejected(self):
+        '''
+        Test that malformed due date filters are a bad request, for listing and bulk changes alike
+        '''
+        url = reverse('tasks')
+        for query in ['?due_date_from=abc', '?due_date_to=zzz', '?due_date_to=2024-02-30']:
+            response = self.client.get(url + query, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.delete(url + '?due_date_to=zzz&dry_run=true', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url + '?due_date_from=abc', {"name": "Renamed"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_agenda(self):
+        '''
+        Test that the agenda lists the next open tasks by due date, overdue first
+        '''
+        url = reverse('task-agenda')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['id'] for task in response.data], [self.overdue, self.due_soon, self.due_later])
+        response = self.client.get(url + '?limit=1', format='json')
+        self.assertEqual([task['id'] for task in response.data], [self.overdue])
+
+    def test_agenda_queries_use_index(self):
+        '''
+        Test that agenda-style queries walk an index instead of sorting all the user's tasks
+        '''
+        open_by_due = self.user.task_set.filter(completed_date__isnull=True).order_by('due_date', 'id')[:10]
+        completed = self.user.task_set.filter(completed_date__isnull=False).order_by('-completed_date', '-id')[:10]
+        all_by_completed = self.user.task_set.order_by('completed_date', 'id')[:10]
+        all_by_due = self.user.task_set.order_by('due_date', 'id')[:10]
+        all_by_id = self.user.task_set.order_by('id')[:10]
+        for queryset, index in [(open_by_due, 'task_user_open_due_idx'),
+                                (completed, 'task_user_completed_idx'),
+                                (all_by_completed, 'task_user_completed_idx'),
+                                (all_by_due, 'task_user_due_idx'),
+                                (all_by_id, 'tasks_task_user_id')]:
+            plan = queryset.explain()
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TaskTagTests(APITestCase):
+    def setUp(self):
+        user_response = TestUtils.register_default_test_user(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user_response.data["token"]}')
+
+    def create_task(self, name, tags):
+        task_data = {"name": name, "description": "Got to be done!", "due_date": "2024-03-01", "tags": tags}
+        response = self.client.post(reverse('tasks'), task_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_create_and_update_tags(self):
+        '''
+        Test that tags can be set when creating or updating a task
+        '''
+        task_id = self.create_task("Take the bins out", ["home", "chores"])
+        url = reverse('tasks') + f'{task_id}/'
+        self.assertEqual(self.client.get(url, format='json').data['tags'], ["chores", "home"])
+        self.client.put(url, {"tags": ["home"]}, format='json')
+        self.assertEqual(self.client.get(url, format='json').data['tags'], ["home"])
+        # Tags are left alone when not part of the update.
+        self.client.put(url, {"name": "Take the bins out now"}, format='json')
+        self.assertEqual(self.client.get(url, format='json').data['tags'], ["home"])
+
+    def test_filter_by_tags(self):
+        '''
+        Test that tasks can be filtered by one tag, or by having all of several tags
+        '''
+        bins = self.create_task("Take the bins out", ["home", "chores"])
+        washing = self.create_task("Do the washing up", ["home"])
+        self.create_task("Create a REST API", ["work"])
+        url = reverse('tasks')
+        response = self.client.get(url + '?tag=home', format='json')
+        self.assertEqual([task['id'] for task in response.data], [bins, washing])
+        response = self.client.get(url + '?tags_all=home,chores', format='json')
+        self.assertEqual([task['id'] for task in response.data], [bins])
+        response = self.client.get(url + '?tag=home&tags_all=work', format='json')
+        self.assertEqual(response.data, [])
+
+    def test_tags_are_per_user(self):
+        '''
+        Test that another user's tags don't match this user's tasks
+        '''
+        self.create_task("Take the bins out", ["home"])
+        other_token = TestUtils.register_user(self.client, 'other@user.com', 'Password1!').data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token}')
+        self.create_task("Do the washing up", ["home"])
+        response = self.client.get(reverse('tasks') + '?tag=home', format='json')
+        self.assertEqual([task['name'] for task in response.data], ["Do the washing up"])
+
+    def test_list_query_count_is_constant(self):
+        '''
+        Test that listing tasks costs the same number of queries however many tasks and tags there are
+        '''
+        url = reverse('tasks')
+        self.create_task("Take the bins out", ["home"])
+        # Token lookup, tasks, and one prefetch for all their tags.
+        with self.assertNumQueries(3):
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 1)
+
+        for i in range(20):
+            self.create_task(f"Task {i}", [f"tag{j}" for j in range(i % 5 + 1)])
+        with self.assertNumQueries(3):
+            response = self.client.get(url + '?tag=tag0', format='json')
+        self.assertEqual(len(response.data), 20)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('task-agenda') + '?limit=20', format='json')
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(response.data[-1]['tags'], ["tag0", "tag1", "tag2", "tag3"])
+
+
+class TaskBulkChangeTests(APITestCase):
+    def setUp(self):
+        user_response = TestUtils.register_default_test_user(self.client)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user_response.data["token"]}')
+        url = reverse('tasks')
+        for name, due_date in [("Take the bins out", "2024-03-01"),
+                               ("Do the washing up", "2024-02-01"),
+                               ("Create a REST API", "2024-02-01")]:
+            self.client.post(url, {"name": name, "description": "Got to be done!", "due_date": due_date},
+                             format='json')
+
+    def test_bulk_update(self):
+        '''
+        Test that PATCH on the task list updates every task matching the filters in one go
+        '''
+        url = reverse('tasks')
+        with self.assertNumQueries(6):
+            # Token lookup, savepoint, no-op UPDATE taking the write lock, capped COUNT, UPDATE, release.
+            response = self.client.patch(url + '?due_date_to=2024-02-01', {"completed_date": "2024-02-02"},
+                                         format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'count': 2, 'dry_run': False})
+        response = self.client.get(url + '?status=completed', format='json')
+        self.assertEqual({task['name'] for task in response.data}, {"Do the washing up", "Create a REST API"})
+
+    def test_bulk_delete(self):
+        '''
+        Test that DELETE on the task list removes every task matching the filters
+        '''
+        url = reverse('tasks')
+        with self.assertNumQueries(9):
+            # Token lookup, savepoint, no-op UPDATE taking the write lock, capped COUNT, task ids,
+            # DELETE tag links, DELETE sent reminders, DELETE tasks, release.
+            response = self.client.delete(url + '?due_date_to=2024-02-15', format='json')
+        self.assertEqual(response.data, {'count': 2, 'dry_run': False})
+        response = self.client.get(url, format='json')
+        self.assertEqual([task['name'] for task in response.data], ["Take the bins out"])
+
+    def test_bulk_delete_by_tag(self):
+        '''
+        Test that deleting by tag removes the tasks, their tag links and sent reminders, but not the tags
+        '''
+        url = reverse('tasks')
+        task_id = self.client.post(url, {"name": "Hoover", "description": "Got to be done!",
+                                         "due_date": "2024-03-01", "tags": ["home", "chores"]},
+                                   format='json').data['id']
+        task = Task.objects.get(pk=task_id)
+        SentReminder.objects.using(task._state.db).create(task_id=task_id, due_date=task.due_date)
+        response = self.client.delete(url + '?tag=home', format='json')
+        self.assertEqual(response.data, {'count': 1, 'dry_run': False})
+        self.assertFalse(Task.tags.through.objects.filter(task_id=task_id).exists())
+        self.assertFalse(SentReminder.objects.using(task._state.db).filter(task_id=task_id).exists())
+        user = User.objects.get(email='test@user.com')
+        self.assertEqual(user.task_set.count(), 3)
+        self.assertEqual(user.tag_set.count(), 2)
+
+    def test_bulk_dry_run(self):
+        '''
+        Test that a dry run reports how many tasks would change without changing them
+        '''
+        url = reverse('tasks')
+        response = self.client.delete(url + '?description=done&dry_run=true', format='json')
+        self.assertEqual(response.data, {'count': 3, 'dry_run': True})
+        response = self.client.patch(url + '?name=bins&dry_run=true', {"name": "Renamed"}, format='json')
+        self.assertEqual(response.data, {'count': 1, 'dry_run': True})
+        response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['name'], "Take the bins out")
+
+    @override_settings(TASK_BULK_MAX_ROWS=2)
+    def test_bulk_row_limit(self):
+        '''
+        Test that a bulk change touching more tasks than allowed is rejected and rolled back
+        '''
+        url = reverse('tasks')
+        with self.assertNumQueries(5):
+            # Token lookup, savepoint, no-op UPDATE, capped COUNT, release: nothing is deleted and rolled back.
+            response = self.client.delete(url + '?description=done', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url + '?description=done', {"completed_date": "2024-02-02"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url + '?status=open', format='json')
+        self.assertEqual(len(response.data), 3)
+
+    def test_bulk_requires_filter_and_fields(self):
+        '''
+        Test that bulk changes need a filter, and updates need valid fields
+        '''
+        url = reverse('tasks')
+        response = self.client.delete(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url + '?name=bins', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url + '?name=bins', {"due_date": "not a date"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url + '?name=bins', {"tags": ["home"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 3)
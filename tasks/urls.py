@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import TaskAPIView, UserLoginAPIView, UserRegistrationAPIView
+from .views import TaskAgendaAPIView, TaskAPIView, TaskEventStreamView, UserLoginAPIView, UserRegistrationAPIView
 
 urlpatterns = [
     path('register/', UserRegistrationAPIView.as_view(), name='register'),
     path('login/', UserLoginAPIView.as_view(), name='login'),
     path('tasks/', TaskAPIView.as_view(), name='tasks'),
     path('tasks/<int:task_id>/', TaskAPIView.as_view(), name='tasks'),
+    path('tasks/agenda/', TaskAgendaAPIView.as_view(), name='task-agenda'),
+    path('tasks/events/', TaskEventStreamView.as_view(), name='task-events'),
 ]
\ No newline at end of file
@@ -1,12 +1,25 @@
-from rest_framework import status
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from .serializers import TaskSerializer, UserLoginSerializer, UserRegistrationSerializer
 from rest_framework.permissions import IsAuthenticated
-from .models import Task
+from .events import EventStream, get_broker, publish_task_event
+from .group_commit import GroupCommitTimeout
+from .models import SentReminder, Task
+from .profiling import ProfiledViewMixin
 
-class UserRegistrationAPIView(APIView):
+class UserRegistrationAPIView(ProfiledViewMixin, APIView):
     def post(self, request, *args, **kwargs):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
@@ -17,7 +30,7 @@ class UserRegistrationAPIView(APIView):
             return Response({"token": token.key}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-class UserLoginAPIView(APIView):
+class UserLoginAPIView(ProfiledViewMixin, APIView):
     def post(self, request, *args, **kwargs):
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -26,14 +39,121 @@ class UserLoginAPIView(APIView):
             return Response({"token": token.key}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class TaskAPIView(APIView):
+TASK_FILTERS = ('name', 'description', 'due_date_from', 'due_date_to', 'status', 'tag', 'tags_all')
+TASK_ORDERINGS = ('due_date', 'completed_date', 'id')
+TASK_STATUSES = ('open', 'completed', 'overdue')
+MAX_TASK_LIMIT = 100
+# Ids per DELETE statement, within SQLite's default cap on query parameters.
+BULK_DELETE_CHUNK_SIZE = 900
+
+
+def filter_tasks(request):
+    '''
+    Return the user's tasks narrowed down by the list filters in the query string.
+    '''
+    name_filter = request.query_params.get('name', None)
+    desc_filter = request.query_params.get('description', None)
+    due_date_from = request.query_params.get('due_date_from', None)
+    due_date_to = request.query_params.get('due_date_to', None)
+    status_filter = request.query_params.get('status', None)
+    tag_filter = request.query_params.get('tag', None)
+    tags_all_filter = request.query_params.get('tags_all', None)
+
+    filter_kwargs = {}
+    if name_filter:
+        filter_kwargs['name__icontains'] = name_filter
+    if desc_filter:
+        filter_kwargs['description__icontains'] = desc_filter
+    if due_date_from:
+        filter_kwargs['due_date__gte'] = parse_date_param('due_date_from', due_date_from)
+    if due_date_to:
+        filter_kwargs['due_date__lte'] = parse_date_param('due_date_to', due_date_to)
+    if status_filter:
+        if status_filter not in TASK_STATUSES:
+            raise ValidationError({'status': f"Must be one of: {', '.join(TASK_STATUSES)}."})
+        # Open and overdue tasks are served by the partial index on open tasks.
+        filter_kwargs['completed_date__isnull'] = status_filter != 'completed'
+        if status_filter == 'overdue':
+            filter_kwargs['due_date__lt'] = timezone.localdate()
+    if tag_filter:
+        filter_kwargs['tags__name'] = tag_filter
+
+    tasks = request.user.task_set.filter(**filter_kwargs)
+    if tags_all_filter:
+        # One indexed join per tag; tag names are unique per user, so no duplicate rows.
+        for name in set(tags_all_filter.split(',')):
+            tasks = tasks.filter(tags__name=name)
+    return tasks
+
+
+def parse_date_param(name, value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Must be a date in YYYY-MM-DD format.'})
+    return parsed
+
+
+def order_tasks(tasks, ordering):
+    '''
+    Order tasks by one of TASK_ORDERINGS, optionally prefixed with '-'.
+    '''
+    field = ordering.removeprefix('-')
+    if field not in TASK_ORDERINGS:
+        raise ValidationError({'ordering': f"Must be one of: {', '.join(TASK_ORDERINGS)}, optionally prefixed with '-'."})
+    if field == 'id':
+        return tasks.order_by(ordering)
+    # Break ties on id, which the (user, <field>) indexes already order by.
+    direction = '-' if ordering.startswith('-') else ''
+    return tasks.order_by(ordering, f'{direction}id')
+
+
+def parse_limit(limit, default=None):
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValidationError({'limit': 'Must be a whole number.'})
+    if not 1 <= limit <= MAX_TASK_LIMIT:
+        raise ValidationError({'limit': f'Must be between 1 and {MAX_TASK_LIMIT}.'})
+    return limit
+
+def delete_tasks(tasks):
+    '''
+    Delete tasks with their tag links and sent reminders, without loading the
+    tasks, which QuerySet.delete() does to cascade the tags. Only the ids are
+    read, as the tag filters may join on the very links being deleted. Returns
+    how many tasks were deleted.
+    '''
+    task_ids = list(tasks.values_list('id', flat=True))
+    connection = connections[tasks.db]
+    table = connection.ops.quote_name(Task._meta.db_table)
+    deleted = 0
+    for start in range(0, len(task_ids), BULK_DELETE_CHUNK_SIZE):
+        chunk = task_ids[start:start + BULK_DELETE_CHUNK_SIZE]
+        # Nothing refers to these rows, so each is one DELETE.
+        Task.tags.through.objects.using(tasks.db).filter(task_id__in=chunk).delete()
+        SentReminder.objects.using(tasks.db).filter(task_id__in=chunk).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+            deleted += cursor.rowcount
+    return deleted
+
+class TaskAPIView(ProfiledViewMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
 
         serializer = TaskSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            task = serializer.save()
+            try:
+                task = serializer.save()
+            except GroupCommitTimeout:
+                return Response({"error": "Task could not be saved in time, please try again"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
             return Response({'id': task.pk}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -48,22 +168,14 @@ class TaskAPIView(APIView):
             except Task.DoesNotExist:
                 return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
         else:
-            name_filter = request.query_params.get('name', None)
-            desc_filter = request.query_params.get('description', None)
-            due_date_from = request.query_params.get('due_date_from', None)
-            due_date_to = request.query_params.get('due_date_to', None)
-
-            filter_kwargs = {}
-            if name_filter:
-                filter_kwargs['name__icontains'] = name_filter
-            if desc_filter:
-                filter_kwargs['description__icontains'] = desc_filter
-            if due_date_from:
-                filter_kwargs['due_date__gte'] = due_date_from
-            if due_date_to:
-                filter_kwargs['due_date__lte'] = due_date_to
-
-            tasks = request.user.task_set.filter(**filter_kwargs)
+            tasks = filter_tasks(request)
+            # Default to creation order, which the index on user already gives us.
+            tasks = order_tasks(tasks, request.query_params.get('ordering', None) or 'id')
+            limit = request.query_params.get('limit', None)
+            if limit:
+                tasks = tasks[:parse_limit(limit)]
+            # One query for all the listed tasks' tags, not one per task.
+            tasks = tasks.prefetch_related('tags')
 
             serializer = TaskSerializer(tasks, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -81,12 +193,121 @@ class TaskAPIView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def patch(self, request, *args, **kwargs):
+        if not kwargs.get('task_id'):
+            return self.bulk_update(request)
+        # Updates are already partial, so PATCH on a single task is the same as PUT.
+        return self.put(request, *args, **kwargs)
+
     def delete(self, request, *args, **kwargs):
         task_id = kwargs.get('task_id')
+        if not task_id:
+            return self.bulk_delete(request)
         try:
             task = request.user.task_set.get(pk=task_id)
         except Task.DoesNotExist:
             return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
 
         task.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        publish_task_event(request.user.pk, 'task.deleted', {'id': task_id})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def bulk_tasks(self, request):
+        '''
+        The tasks a bulk update or delete applies to, picked by the list filters.
+        '''
+        if not any(request.query_params.get(param) for param in TASK_FILTERS):
+            raise ValidationError({'error': f"Bulk changes need at least one filter: {', '.join(TASK_FILTERS)}."})
+        return filter_tasks(request)
+
+    def apply_bulk_change(self, request, tasks, change):
+        '''
+        Run `change` (returning the number of tasks it touched) in one transaction,
+        unless more than TASK_BULK_MAX_ROWS tasks match. With ?dry_run=true,
+        only count the matching tasks.
+        '''
+        max_rows = getattr(settings, 'TASK_BULK_MAX_ROWS', 1000)
+        if request.query_params.get('dry_run') == 'true':
+            return Response({'count': tasks.count(), 'dry_run': True}, status=status.HTTP_200_OK)
+
+        with transaction.atomic(using=tasks.db):
+            # Write first so SQLite takes the write lock before we read: upgrading
+            # a read lock fails outright if another request is writing.
+            Task.objects.using(tasks.db).filter(pk__lt=0).update(completed_date=F('completed_date'))
+            # Counting stops one row past the cap, so a huge match is rejected cheaply.
+            count = tasks[:max_rows + 1].count()
+            if count <= max_rows:
+                count = change()
+                # Rows written concurrently since the count can still tip it over.
+                if count > max_rows:
+                    transaction.set_rollback(True, using=tasks.db)
+        if count > max_rows:
+            return Response({'error': f'More than {max_rows} tasks match, the limit per request. '
+                                      'Narrow the filters and try again.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'count': count, 'dry_run': False}, status=status.HTTP_200_OK)
+
+    def bulk_update(self, request):
+        tasks = self.bulk_tasks(request)
+        serializer = TaskSerializer(data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        fields = serializer.validated_data
+        if 'tags' in fields:
+            return Response({'tags': ["Tags can't be changed in bulk."]}, status=status.HTTP_400_BAD_REQUEST)
+        if not fields:
+            return Response({'error': 'No fields to update.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = self.apply_bulk_change(request, tasks, lambda: tasks.update(**fields))
+        if response.data.get('count') and not response.data['dry_run']:
+            publish_task_event(request.user.pk, 'task.bulk_updated', {'count': response.data['count']})
+        return response
+
+    def bulk_delete(self, request):
+        tasks = self.bulk_tasks(request)
+        response = self.apply_bulk_change(request, tasks, lambda: delete_tasks(tasks))
+        if response.data.get('count') and not response.data['dry_run']:
+            publish_task_event(request.user.pk, 'task.bulk_deleted', {'count': response.data['count']})
+        return response
+
+class TaskAgendaAPIView(ProfiledViewMixin, APIView):
+    '''
+    The user's next open tasks by due date, overdue ones first.
+    '''
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        limit = parse_limit(request.query_params.get('limit', None), default=10)
+        tasks = filter_tasks(request).filter(completed_date__isnull=True)
+        # Walks the open-task index in order and stops after `limit` rows.
+        tasks = order_tasks(tasks, 'due_date')[:limit].prefetch_related('tags')
+
+        serializer = TaskSerializer(tasks, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class TaskEventStreamView(View):
+    '''
+    Server-Sent Events feed of the current user's task changes.
+
+    This is an async view so an idle connection costs a queue rather than a
+    worker thread; it must be served through the ASGI application.
+    '''
+    async def get(self, request, *args, **kwargs):
+        try:
+            user_auth = await sync_to_async(TokenAuthentication().authenticate)(request)
+        except exceptions.AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if user_auth is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        user, _ = user_auth
+
+        config = getattr(settings, 'TASK_EVENTS', {})
+        stream = EventStream(get_broker(), user.pk,
+                             heartbeat_interval=config.get('HEARTBEAT_INTERVAL', 15),
+                             retry_ms=config.get('RETRY_MS', 3000))
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
\ No newline at end of file
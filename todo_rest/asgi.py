@@ -2,6 +2,8 @@
 ASGI config for todo_rest project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project through this (e.g. with uvicorn or daphne) so the task event
+stream can hold many idle connections without tying up a thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,7 +49,43 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Task change events streamed from /api/tasks/events/. Switch BACKEND to
+# 'tasks.events.FileBackend' (with OPTIONS={'path': ...}) to share events
+# between several workers on one host; its spool is rotated at
+# OPTIONS['max_bytes'] (10 MB by default).
+TASK_EVENTS = {
+    'BACKEND': 'tasks.events.InProcessBackend',
+    'HEARTBEAT_INTERVAL': 15,
+    'RETRY_MS': 3000,
+    'MAX_QUEUE_SIZE': 100,
+}
+
+# Most tasks a single bulk PATCH or DELETE on /api/tasks/ may change.
+TASK_BULK_MAX_ROWS = 1000
+
+# Requests to the API views are profiled with cProfile when they send an
+# X-Profile-Key header matching KEY, or at random at SAMPLE_RATE (0 to 1).
+# See `manage.py profile_hotspots`.
+TASK_PROFILING = {
+    'KEY': os.environ.get('TASK_PROFILING_KEY'),
+    'SAMPLE_RATE': 0.0,
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_FILES': 500,
+}
+
+# Queries slower than THRESHOLD_MS are logged and totalled per SQL fingerprint,
+# with their query plan. Off unless TASK_SLOW_QUERY_LOG=1 is set in the
+# environment, e.g. on production servers. See `manage.py slow_queries`.
+TASK_SLOW_QUERY_LOG = {
+    'ENABLED': os.environ.get('TASK_SLOW_QUERY_LOG') == '1',
+    'THRESHOLD_MS': 100,
+    'DIRECTORY': BASE_DIR / 'slow_queries',
+    'FLUSH_INTERVAL': 10,
+    'MAX_FINGERPRINTS': 500,
+}
+
 MIDDLEWARE = [
+    'tasks.querylog.SlowQueryLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +126,45 @@ DATABASES = {
     }
 }
 
+# Tasks are sharded per user across TASK_SHARD_COUNT SQLite files, the first
+# being the default database. Extra shard databases beyond the active ones can
+# be kept configured with TASK_SHARD_DATABASE_COUNT so that
+# `manage.py rebalance_task_shards` can drain them after shrinking.
+TASK_SHARD_COUNT = int(os.environ.get('TASK_SHARD_COUNT', 1))
+TASK_SHARD_DATABASE_COUNT = max(TASK_SHARD_COUNT, int(os.environ.get('TASK_SHARD_DATABASE_COUNT', 1)))
+TASK_SHARD_DATABASES = ['default'] + [f'tasks_shard_{i}' for i in range(1, TASK_SHARD_DATABASE_COUNT)]
+TASK_SHARDS = TASK_SHARD_DATABASES[:TASK_SHARD_COUNT]
+for alias in TASK_SHARD_DATABASES[1:]:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+    }
+
+# Sharded task ids are reserved from the default database this many at a time.
+TASK_ID_BLOCK_SIZE = 100
+
+DATABASE_ROUTERS = ['tasks.sharding.TaskShardRouter']
+
+# Reminders for open tasks coming due within LEAD_DAYS, sent by
+# `manage.py send_reminders`. Switch SINK to 'tasks.reminders.FileSink' (with
+# OPTIONS={'path': ...}) to collect them in a file instead of the log.
+TASK_REMINDERS = {
+    'SINK': 'tasks.reminders.LogSink',
+    'OPTIONS': {},
+    'LEAD_DAYS': 1,
+    'BATCH_SIZE': 1000,
+    'INTERVAL': 60,
+}
+
+# Batch task creations arriving within WINDOW_MS into one commit, trading a
+# few milliseconds of latency for far fewer fsyncs under bursty load.
+TASK_GROUP_COMMIT = {
+    'ENABLED': False,
+    'WINDOW_MS': 5,
+    'MAX_BATCH_SIZE': 200,
+    'TIMEOUT': 5,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators